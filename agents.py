@@ -1,14 +1,12 @@
 # Importing libraries and files
-import os
-from crewai import LLM
-from dotenv import load_dotenv
 from crewai import Agent
 # MODIFIED: Import all necessary tools
-from tools import search_tool, blood_test_tool, nutrition_tool, exercise_tool
+from tools import search_tool, blood_test_tool, biomarker_tool, nutrition_tool, exercise_tool
 from config import shared_llm as llm
 
-load_dotenv()
-api_key = os.getenv("GEMINI_API_KEY")
+# NOTE: agents run with cache=False. crewai's tool cache is keyed on the tool's arguments (a file path,
+# not the file's content) and lives as long as the agent, which the worker reuses across jobs.
+# Report text and searches are cached by content and with a TTL in tools.py instead.
 
 # Creating an Experienced Doctor agent
 doctor=Agent(
@@ -22,11 +20,12 @@ doctor=Agent(
         "You are careful to identify values that fall outside standard reference ranges and explain their potential significance in a clear, objective manner. "
         "You always emphasize that your analysis is for informational purposes and is not a substitute for professional medical advice from a qualified doctor."
     ),
-    # MODIFIED: Added search_tool for broader context
-    tools=[blood_test_tool, search_tool],
+    # MODIFIED: Added search_tool for broader context, reads the extracted biomarker table instead of the raw text
+    tools=[biomarker_tool, search_tool],
+    cache=False,
     llm=llm,
     max_iter=3,
-    max_rpm=2,
+    # NOTE: no per-process max_rpm here, LLM and search calls are throttled fleet-wide in rate_limiter.py
     allow_delegation=False
 )
 
@@ -44,6 +43,7 @@ verifier = Agent(
     ),
     # MODIFIED: Explicitly assign the tool it will use
     tools=[blood_test_tool],
+    cache=False,
     llm=llm,
     allow_delegation=False
 )
@@ -61,6 +61,7 @@ nutritionist = Agent(
     ),
     # MODIFIED: Assign the new nutrition_tool and search_tool
     tools=[nutrition_tool, search_tool],
+    cache=False,
     llm=llm,
     allow_delegation=False
 )
@@ -77,6 +78,7 @@ exercise_specialist = Agent(
     ),
     # MODIFIED: Assign the new exercise_tool and search_tool
     tools=[exercise_tool, search_tool],
+    cache=False,
     llm=llm,
     allow_delegation=False
 )
@@ -0,0 +1,87 @@
+## Asyncio execution mode: many crews per worker process
+# A prefork slot is blocked for the whole multi-minute job although it is nearly always waiting on
+# the LLM and search APIs, so throughput needed dozens of processes of a few hundred MB each.
+# In async mode every worker process runs one event loop that executes up to ASYNC_CONCURRENCY
+# jobs at once, each with a crew from the process's pool (worker.checkout_crew). crewai's agents
+# call the LLM and tools synchronously, so each crew runs through Crew.kickoff_async (a thread from the loop's executor) and the job's
+# database writes go through asyncio.to_thread; the loop itself never blocks.
+# The job phases are worker.AnalysisJob, shared with the prefork task, so results are identical.
+#   WORKER_MODE=async celery -A celery_app worker --pool threads --concurrency 64
+# (Celery's threads only wait for the loop; ASYNC_CONCURRENCY caps the crews actually running.)
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ASYNC_CONCURRENCY
+from report_assembler import task_outputs
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+async def run_job(job) -> dict:
+    """The async counterpart of worker.AnalysisJob.run."""
+    from worker import checkout_crew
+
+    try:
+        skip = await asyncio.to_thread(job.start)
+        if job.complete:
+            return await asyncio.to_thread(job.finish, None, {})
+        # Building a crew takes a moment too, so it is checked out off the loop as well
+        checkout = checkout_crew(skip)
+        medical_crew = await asyncio.to_thread(checkout.__enter__)
+        try:
+            await asyncio.to_thread(job.attach, medical_crew)
+            try:
+                result = await medical_crew.kickoff_async(job.inputs)
+                outputs = task_outputs(medical_crew.tasks)
+            finally:
+                job.detach(medical_crew)
+        finally:
+            checkout.__exit__(None, None, None)
+        return await asyncio.to_thread(job.finish, result, outputs)
+    except Exception as e:
+        await asyncio.to_thread(job.handle_error, e)
+        raise
+
+
+class AsyncAnalysisRunner:
+    """An event loop on a background thread that runs at most `concurrency` analysis jobs at a time."""
+
+    def __init__(self, concurrency: int = ASYNC_CONCURRENCY):
+        from worker import prebuild_crews
+
+        self.concurrency = concurrency
+        # One crew per slot up front; jobs resumed from checkpoints (other skip sets) build theirs on demand
+        prebuild_crews(concurrency)
+        self.loop = asyncio.new_event_loop()
+        # One thread per running crew plus a few for the jobs' database writes
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 4, thread_name_prefix="crew-job"))
+        self._slots = asyncio.Semaphore(concurrency)
+        self._thread = threading.Thread(target=self.loop.run_forever, name="crew-event-loop", daemon=True)
+        self._thread.start()
+
+    async def run(self, job) -> dict:
+        async with self._slots:
+            return await run_job(job)
+
+    def submit(self, job):
+        """Schedules a worker.AnalysisJob from any thread; returns a concurrent.futures.Future for its result."""
+        return asyncio.run_coroutine_threadsafe(self.run(job), self.loop)
+
+    def run_blocking(self, job) -> dict:
+        return self.submit(job).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+def get_runner() -> AsyncAnalysisRunner:
+    """The runner of this worker process, started on first use."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = AsyncAnalysisRunner()
+        return _runner
@@ -0,0 +1,192 @@
+## Async vs prefork worker modes: memory per in-flight job and jobs/sec, with the offline stubs
+# Each mode runs in a fresh interpreter against its own throwaway database (see e2e.py):
+#   prefork: N forked processes, each running one `run_crew_analysis` at a time (like Celery's prefork pool)
+#   async:   one process with an AsyncAnalysisRunner running up to N jobs at once (WORKER_MODE=async)
+# Memory is the peak proportional set size (PSS, which splits pages shared after a fork fairly) of
+# all processes doing the work, sampled every 50 ms and divided by N. Needs Linux's /proc.
+#   python benchmarks/async_vs_prefork.py [--concurrency 4 16] [--jobs 32] [--llm-latency 0.2]
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime
+
+import e2e
+
+SAMPLE_INTERVAL = 0.05
+
+
+def pss_kib(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass # the process exited between sampling rounds
+    return 0
+
+
+class PssSampler(threading.Thread):
+    """Tracks the peak combined PSS of the processes returned by `pids()` until stopped."""
+
+    def __init__(self, pids):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.peak_kib = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak_kib = max(self.peak_kib, sum(pss_kib(pid) for pid in self.pids()))
+            self._stop_event.wait(SAMPLE_INTERVAL)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def create_jobs(count: int, files, query: str) -> list:
+    from database import SessionLocal, AnalysisResult
+
+    db = SessionLocal()
+    try:
+        records = [
+            AnalysisResult(task_id=f"bench-{i}-{time.time_ns()}", file_path=files[i % len(files)], query=query)
+            for i in range(count)
+        ]
+        db.add_all(records)
+        db.commit()
+        return [{"query": query, "file_path": record.file_path, "result_id": record.id} for record in records]
+    finally:
+        db.close()
+
+
+def _init_prefork_child():
+    import database
+
+    # Connections must not be shared with the parent across the fork
+    database.engine.dispose()
+    sys.stdout = open(os.devnull, "w")
+
+
+def _run_prefork_job(kwargs) -> bool:
+    from worker import run_crew_analysis
+
+    return run_crew_analysis.apply(kwargs=kwargs).successful()
+
+
+def run_prefork(jobs, concurrency: int):
+    import multiprocessing
+
+    import database
+    import worker # noqa: F401 (imported before the fork, as Celery does)
+
+    database.engine.dispose()
+    with multiprocessing.get_context("fork").Pool(concurrency, initializer=_init_prefork_child) as pool:
+        sampler = PssSampler(lambda: [process.pid for process in pool._pool])
+        sampler.start()
+        started = time.perf_counter()
+        outcomes = pool.map(_run_prefork_job, jobs, chunksize=1)
+        wall = time.perf_counter() - started
+        sampler.stop()
+    return outcomes, wall, sampler.peak_kib
+
+
+def run_async(jobs, concurrency: int):
+    from async_worker import AsyncAnalysisRunner
+    from worker import AnalysisJob
+
+    runner = AsyncAnalysisRunner(concurrency)
+    sampler = PssSampler(lambda: [os.getpid()])
+    sampler.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        futures = [runner.submit(AnalysisJob(**kwargs)) for kwargs in jobs]
+        outcomes = [future.exception() is None for future in futures]
+    wall = time.perf_counter() - started
+    sampler.stop()
+    runner.close()
+    return outcomes, wall, sampler.peak_kib
+
+
+def run_mode(args) -> dict:
+    """Runs one mode in this (fresh) process and returns its measurements."""
+    warnings.filterwarnings("ignore")
+    workdir = tempfile.mkdtemp(prefix="crew-bench-")
+    e2e.configure_environment(workdir)
+    import stubs
+
+    stubs.install(args.llm_latency, args.completion_tokens, args.tool_calls, args.search_latency)
+    import database
+
+    database.init_db()
+    files = args.files or [os.path.join("data", "sample.pdf")]
+    jobs = create_jobs(args.jobs, files, "Summarise my Blood Test Report and give me some health recommendations")
+    runner = run_prefork if args.run == "prefork" else run_async
+    outcomes, wall, peak_kib = runner(jobs, args.concurrency[0])
+    return {
+        "mode": args.run,
+        "concurrency": args.concurrency[0],
+        "jobs": len(jobs),
+        "failures": outcomes.count(False),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_second": round(len(jobs) / wall, 3),
+        "peak_pss_mib": round(peak_kib / 1024, 1),
+        "mib_per_inflight_job": round(peak_kib / 1024 / args.concurrency[0], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the prefork and async worker modes offline.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16])
+    parser.add_argument("--jobs", type=int, default=None, help="Jobs per run (default: 2x concurrency, at least 8)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per stub LLM call")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--tool-calls", type=int, default=1)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--files", nargs="+", default=None)
+    parser.add_argument("--output", default=None, help="Where to write the JSON results")
+    parser.add_argument("--run", choices=("prefork", "async"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args)))
+        return
+
+    forwarded = [
+        "--llm-latency", str(args.llm_latency), "--completion-tokens", str(args.completion_tokens),
+        "--tool-calls", str(args.tool_calls), "--search-latency", str(args.search_latency),
+    ] + (["--files", *args.files] if args.files else [])
+    runs = []
+    for concurrency in args.concurrency:
+        jobs = args.jobs or max(8, 2 * concurrency)
+        for mode in ("prefork", "async"):
+            command = [sys.executable, os.path.abspath(__file__), "--run", mode,
+                       "--concurrency", str(concurrency), "--jobs", str(jobs), *forwarded]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(completed.stderr[-2000:])
+                raise SystemExit(f"{mode} run at concurrency {concurrency} failed")
+            run = json.loads(completed.stdout.strip().splitlines()[-1])
+            runs.append(run)
+            print(
+                f"{mode:>7} x{concurrency:<3} {run['jobs_per_second']:7.3f} jobs/s  peak PSS {run['peak_pss_mib']:8.1f} MiB  "
+                f"{run['mib_per_inflight_job']:7.1f} MiB per in-flight job  {run['failures']} failed"
+            )
+
+    os.makedirs(e2e.RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(e2e.RESULTS_DIR, f"async-vs-prefork-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump({"git_revision": e2e.git_revision(), "settings": vars(args), "runs": runs}, f, indent=2)
+    print(f"\nResults written to {os.path.relpath(output, e2e.ROOT)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+## Offline end-to-end benchmark: the real Celery task, crew, tools and database, with stubbed LLM/search
+# Runs `run_crew_analysis` eagerly against a throwaway SQLite database at several concurrency levels
+# and reports jobs/sec, per-stage p50/p95/p99 latency (from analysis_steps) and PDF parse time.
+# Results are written to benchmarks/results/ so runs can be compared.
+#   python benchmarks/e2e.py [--concurrency 1 8 64] [--llm-latency 0.05] [--compare latest]
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+PERCENTILES = (50, 95, 99)
+
+
+def configure_environment(workdir: str):
+    """Points every backend at local throwaway state. Must run before any repo module is imported."""
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        CELERY_BROKER_URL="memory://",
+        CELERY_RESULT_BACKEND="cache+memory://",
+        REPORT_CACHE_DIR=os.path.join(workdir, "report_cache"),
+        LLM_CACHE_ENABLED="false",
+        SEARCH_CACHE_PATH=os.path.join(workdir, "search_cache.sqlite3"),
+        DEDUPE_ENABLED="false",
+        # Unlimited quotas: the stubs measure the pipeline, not the provider's rate limits
+        LLM_RPM="0", LLM_TPM="0", SEARCH_RPM="0",
+        CREWAI_DISABLE_TELEMETRY="true",
+        OTEL_SDK_DISABLED="true",
+    )
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+
+def percentiles(samples) -> dict:
+    if not len(samples):
+        return {f"p{p}": None for p in PERCENTILES}
+    values = np.percentile(np.asarray(samples, dtype=np.float64), PERCENTILES)
+    return {f"p{p}": round(float(v), 4) for p, v in zip(PERCENTILES, values)}
+
+
+def measure_pdf_parsing(files, repeats: int) -> dict:
+    """Cold parse (PyPDF + normalisation), biomarker extraction and warm cache lookups per file."""
+    from tools import extract_report_text, report_cache
+    from biomarkers import extract_biomarkers
+
+    results = {}
+    for file_path in files:
+        cold, extract = [], []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            text = extract_report_text(file_path)
+            cold.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            extract_biomarkers(text)
+            extract.append(time.perf_counter() - started)
+        report_cache.get_or_extract(file_path, extract_report_text)
+        started = time.perf_counter()
+        report_cache.get_or_extract(file_path, extract_report_text)
+        warm = time.perf_counter() - started
+        results[os.path.relpath(file_path, ROOT)] = {
+            "parse_median_seconds": round(float(np.median(cold)), 4),
+            "biomarkers_median_seconds": round(float(np.median(extract)), 5),
+            "cached_lookup_seconds": round(warm, 6),
+            "characters": len(text),
+        }
+    return results
+
+
+def run_level(concurrency: int, jobs: int, files, query: str, quiet: bool) -> dict:
+    from database import SessionLocal, AnalysisResult, AnalysisStep
+    from worker import run_crew_analysis
+
+    db = SessionLocal()
+    try:
+        records = [
+            AnalysisResult(task_id=f"bench-{concurrency}-{i}-{time.time_ns()}", file_path=files[i % len(files)], query=query)
+            for i in range(jobs)
+        ]
+        db.add_all(records)
+        db.commit()
+        result_ids = [record.id for record in records]
+        file_paths = [record.file_path for record in records]
+    finally:
+        db.close()
+
+    def run_one(index):
+        started = time.perf_counter()
+        outcome = run_crew_analysis.apply(
+            kwargs={"query": query, "file_path": file_paths[index], "result_id": result_ids[index]}
+        )
+        return time.perf_counter() - started, outcome.successful()
+
+    sink = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext():
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(run_one, range(jobs)))
+    wall = time.perf_counter() - started
+
+    db = SessionLocal()
+    try:
+        steps = db.query(AnalysisStep.step_name, AnalysisStep.started_at, AnalysisStep.finished_at).filter(
+            AnalysisStep.result_id.in_(result_ids)
+        ).all()
+    finally:
+        db.close()
+    stages = {}
+    for name, step_started, step_finished in steps:
+        if step_started and step_finished:
+            stages.setdefault(name, []).append((step_finished - step_started).total_seconds())
+
+    latencies = [seconds for seconds, _ in outcomes]
+    return {
+        "concurrency": concurrency,
+        "jobs": jobs,
+        "failures": sum(1 for _, ok in outcomes if not ok),
+        "wall_seconds": round(wall, 3),
+        "jobs_per_second": round(jobs / wall, 3),
+        "job_latency_seconds": percentiles(latencies),
+        "stage_latency_seconds": {name: percentiles(samples) for name, samples in sorted(stages.items())},
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, previous_path: str):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\n--- Compared with {os.path.relpath(previous_path, ROOT)} ({previous['meta']['git_revision']}) ---")
+    for key, level in current["levels"].items():
+        before = previous["levels"].get(key)
+        if before is None:
+            continue
+        change = (level["jobs_per_second"] / before["jobs_per_second"] - 1) * 100 if before["jobs_per_second"] else 0.0
+        p95_now, p95_before = level["job_latency_seconds"]["p95"], before["job_latency_seconds"]["p95"]
+        print(
+            f"concurrency {key:>3}: {before['jobs_per_second']:.3f} -> {level['jobs_per_second']:.3f} jobs/s ({change:+.1f}%), "
+            f"job p95 {p95_before:.3f}s -> {p95_now:.3f}s"
+        )
+
+
+def latest_result(exclude: str = None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, "e2e-*.json")) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark with stub LLM and search backends.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--jobs", type=int, default=None, help="Jobs per level (default: 2x concurrency, at least 4)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per stub LLM call")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="Tokens in each stub answer")
+    parser.add_argument("--tool-calls", type=int, default=1, help="Tool calls per task before answering")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Seconds per stub search")
+    parser.add_argument("--pdf-repeats", type=int, default=5)
+    parser.add_argument("--files", nargs="+", default=None, help="PDFs to analyse (default: data/*.pdf)")
+    parser.add_argument("--compare", default=None, help="Result file to compare with, or 'latest'")
+    parser.add_argument("--output", default=None, help="Where to write the JSON results")
+    parser.add_argument("--verbose", action="store_true", help="Show crew output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # crewai/pydantic serialisation warnings would drown the report
+        warnings.filterwarnings("ignore")
+    workdir = tempfile.mkdtemp(prefix="crew-bench-")
+    configure_environment(workdir)
+    import stubs # benchmarks/ is on sys.path as the script's directory
+
+    llm = stubs.install(args.llm_latency, args.completion_tokens, args.tool_calls, args.search_latency)
+    import database
+
+    database.init_db()
+    files = args.files or sorted(glob.glob(os.path.join("data", "*.pdf")))
+    query = "Summarise my Blood Test Report and give me some health recommendations"
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "verbose")},
+            "files": files,
+        },
+        "pdf_parse": measure_pdf_parsing(files, args.pdf_repeats),
+        "levels": {},
+    }
+    for path, timing in results["pdf_parse"].items():
+        print(f"PDF {path}: parse {timing['parse_median_seconds']:.3f}s, biomarkers {timing['biomarkers_median_seconds']:.4f}s")
+
+    for concurrency in args.concurrency:
+        jobs = args.jobs or max(4, 2 * concurrency)
+        calls_before = llm.counters["calls"]
+        level = run_level(concurrency, jobs, files, query, quiet=not args.verbose)
+        level["llm_calls_per_job"] = round((llm.counters["calls"] - calls_before) / jobs, 2)
+        results["levels"][str(concurrency)] = level
+        latency = level["job_latency_seconds"]
+        print(
+            f"concurrency {concurrency:>3}: {jobs} jobs, {level['jobs_per_second']:.3f} jobs/s, "
+            f"job p50/p95/p99 {latency['p50']:.3f}/{latency['p95']:.3f}/{latency['p99']:.3f}s, "
+            f"{level['failures']} failed"
+        )
+        for name, stage in level["stage_latency_seconds"].items():
+            print(f"    {name:22s} p50 {stage['p50']:.3f}s  p95 {stage['p95']:.3f}s  p99 {stage['p99']:.3f}s")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {os.path.relpath(output, ROOT)}")
+
+    previous = latest_result(exclude=output) if args.compare == "latest" else args.compare
+    if previous:
+        compare(results, previous)
+    return results
+
+
+if __name__ == "__main__":
+    main()
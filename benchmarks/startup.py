@@ -0,0 +1,82 @@
+## Startup-time benchmark for the client and the worker
+# Every measurement runs in a fresh interpreter so nothing is already imported or cached.
+#   python benchmarks/startup.py [--runs 5]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet prints a JSON dict; "seconds" is measured inside the child around the work itself
+SCENARIOS = {
+    # What client.py pays before it can enqueue a job
+    "client_import": """
+import time, sys, json
+t = time.perf_counter()
+import client
+print(json.dumps({"seconds": time.perf_counter() - t,
+                  "crewai_loaded": "crewai" in sys.modules,
+                  "langchain_loaded": any(m.startswith("langchain") for m in sys.modules)}))
+""",
+    # What a Celery child process pays to import the task module
+    "worker_import": """
+import time, sys, json
+t = time.perf_counter()
+import worker
+print(json.dumps({"seconds": time.perf_counter() - t,
+                  "crewai_loaded": "crewai" in sys.modules,
+                  "langchain_loaded": any(m.startswith("langchain") for m in sys.modules)}))
+""",
+    # Import plus everything needed before the first crew kickoff
+    "worker_first_crew": """
+import time, sys, json
+t = time.perf_counter()
+import worker
+if hasattr(worker, "get_crew_template"):
+    worker.get_crew_template()
+else:
+    import agents, task
+    from crew_builder import build_crew
+    build_crew(agents=[agents.verifier, agents.doctor, agents.nutritionist, agents.exercise_specialist, agents.report_compiler],
+               tasks=[task.verification, task.help_patients, task.nutrition_analysis, task.exercise_planning, task.compile_report_task])
+first = time.perf_counter() - t
+t = time.perf_counter()
+if hasattr(worker, "get_crew_template"):
+    worker.get_crew_template()
+print(json.dumps({"seconds": first, "second_job_setup_seconds": time.perf_counter() - t}))
+""",
+}
+
+
+def run_scenario(code: str) -> dict:
+    env = dict(os.environ, CREWAI_DISABLE_TELEMETRY="true", OTEL_SDK_DISABLED="true")
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    # Imported modules may print banners, the measurement is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        samples = [run_scenario(code) for _ in range(args.runs)]
+        seconds = [sample["seconds"] for sample in samples]
+        results[name] = {
+            "median_seconds": round(statistics.median(seconds), 4),
+            "min_seconds": round(min(seconds), 4),
+            **{k: v for k, v in samples[-1].items() if k != "seconds"},
+        }
+        print(f"{name:20s} median {results[name]['median_seconds']:.3f}s  {results[name]}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+## Deterministic local stand-ins for Gemini and Serper used by the offline benchmarks
+# StubLLM follows crewai's ReAct prompt format: for a task with tools it first asks for one tool
+# call (so PDF parsing, biomarker extraction and the nested tool LLM calls all really run), then
+# returns a Final Answer padded to a fixed number of tokens. Latency and sizes are configurable.
+import ast
+import json
+import re
+import threading
+import time
+
+from crewai.llms.base_llm import BaseLLM
+
+import metrics
+
+_TOOL = re.compile(r"^Tool Name: (?P<name>.+)\nTool Arguments: (?P<args>\{.*\})$", re.MULTILINE)
+_PDF_PATH = re.compile(r"(\S+\.pdf)\b")
+
+
+class StubLLM(BaseLLM):
+    """Answers every call after `latency` seconds with a canned response of ~`completion_tokens` tokens."""
+
+    def __init__(self, latency: float = 0.05, completion_tokens: int = 200, tool_calls: int = 1):
+        super().__init__(model="stub/benchmark", temperature=0)
+        self.latency = latency
+        self.completion_tokens = completion_tokens
+        self.tool_calls = tool_calls
+        self.cache = None # stands in for CachedLLM, whose cache the stubs never use
+        # Shared by reference, so shallow copies made by Agent.copy() count into the same totals
+        self.counters = {"calls": 0, "prompt_tokens": 0}
+        self._lock = threading.Lock()
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def _answer(self) -> str:
+        words = " ".join(f"finding{i % 50}" for i in range(max(0, self.completion_tokens - 12)))
+        return f"{words}\nDisclaimer: this is not medical advice, consult a qualified doctor."
+
+    def _tool_request(self, messages):
+        """Returns an Action block for the first listed tool, or None once enough tools were used."""
+        system = "\n".join(m["content"] for m in messages if m.get("role") == "system")
+        conversation = "\n".join(m["content"] for m in messages if m.get("role") != "system")
+        match = _TOOL.search(system)
+        if match is None or conversation.count("\nObservation:") >= self.tool_calls:
+            return None
+        pdf = _PDF_PATH.search(conversation)
+        arguments = {}
+        for name in ast.literal_eval(match.group("args")):
+            if name == "file_path" and pdf:
+                arguments[name] = pdf.group(1)
+            elif name == "search_query":
+                arguments[name] = "normal range for hemoglobin"
+            else:
+                arguments[name] = conversation[-2000:]
+        return (
+            "Thought: I should use a tool first\n"
+            f"Action: {match.group('name')}\n"
+            f"Action Input: {json.dumps(arguments)}"
+        )
+
+    def _respond(self, messages) -> str:
+        # Plain prompts come from the nutrition/exercise tools, which expect a bare answer
+        if isinstance(messages, str):
+            return self._answer()
+        action = self._tool_request(messages)
+        if action is not None:
+            return action
+        return f"Thought: I now know the final answer\nFinal Answer: {self._answer()}"
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        started = time.perf_counter()
+        time.sleep(self.latency)
+        text = messages if isinstance(messages, str) else " ".join(str(m.get("content", "")) for m in messages)
+        with self._lock:
+            self.counters["calls"] += 1
+            self.counters["prompt_tokens"] += len(text) // 4
+        response = self._respond(messages)
+        # Reported like a provider call made through CachedLLM
+        metrics.record_llm_call(len(text) // 4, len(response) // 4, time.perf_counter() - started)
+        return response
+
+
+def stub_search(latency: float = 0.05):
+    """Patches the Serper tool so searches return fixed results after `latency` seconds."""
+    from crewai_tools import SerperDevTool
+
+    def _run(self, **kwargs):
+        time.sleep(latency)
+        query = kwargs.get("search_query", "")
+        return {
+            "searchParameters": {"q": query},
+            "organic": [
+                {"title": f"Result {i} for {query}", "link": f"https://example.org/{i}", "snippet": "Reference information."}
+                for i in range(3)
+            ],
+        }
+
+    # RateLimitedSerperDevTool calls super()._run, so the fleet-wide limiter is still exercised
+    SerperDevTool._run = _run
+
+
+def install(llm_latency: float = 0.05, completion_tokens: int = 200, tool_calls: int = 1, search_latency: float = 0.05) -> StubLLM:
+    """
+    Replaces `config.shared_llm` and the search backend. Must run before agents/tools/worker crews
+    are built, since they capture the shared LLM when they are constructed.
+    """
+    import config
+
+    llm = StubLLM(latency=llm_latency, completion_tokens=completion_tokens, tool_calls=tool_calls)
+    config._shared_llm = llm
+    stub_search(search_latency)
+    return llm
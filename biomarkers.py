@@ -0,0 +1,224 @@
+## Deterministic biomarker extraction from blood test report text
+# Parses the lab tables produced by the PDF loader into a compact columnar table
+# (name, value, unit, low, high) so the doctor agent gets the numbers directly instead of
+# scanning every page of raw text for them.
+import re
+import numpy as np
+
+# Longest first so e.g. "mill/mm3" wins over "mm3" and glued values like "mill/mm34.50" split correctly
+UNITS = sorted([
+    "mL/min/1.73m2", "mill/mm3", "thou/mm3", "cells/uL", "cells/µL", "µIU/mL", "uIU/mL", "mIU/mL",
+    "mEq/L", "mmol/L", "µmol/L", "umol/L", "nmol/L", "pmol/L", "µg/dL", "ug/dL", "ng/mL", "ng/dL",
+    "pg/mL", "mg/dL", "gm/dL", "g/dL", "mg/L", "g/L", "IU/L", "U/L", "mm/hr", "fL", "pg", "%",
+], key=len, reverse=True)
+
+# A decimal number as printed in lab reports
+NUMBER = r"\d+(?:\.\d+)?"
+_UNIT = "(?:" + "|".join(re.escape(u) for u in UNITS) + ")"
+_RANGE = rf"(?:(?P<low>{NUMBER})\s*-\s*(?P<high>{NUMBER})|<\s*(?P<lt>{NUMBER})|>\s*(?P<gt>{NUMBER}))"
+
+# " 13.00 - 17.00 g/dL15.00" and " 40.00 - 80.00 Segmented Neutrophils %60.00"
+_RANGE_UNIT_VALUE = re.compile(
+    rf"^\s*{_RANGE}\s+(?:(?P<name>[A-Za-z][^|]*?)\s+)?(?P<unit>{_UNIT})\s*(?P<value>{NUMBER})\s*$"
+)
+# "0.90Creatinine" and "90.00Glucose Fasting  70 - 100 mg/dL"
+_VALUE_NAME = re.compile(
+    rf"^(?P<value>{NUMBER})(?P<name>[A-Za-z][^|]*?)(?:\s+{_RANGE}\s*(?P<unit>{_UNIT})?)?\s*$"
+)
+# " 0.70 - 1.30 mg/dL" following a _VALUE_NAME line
+_RANGE_ONLY = re.compile(rf"^\s*{_RANGE}\s*(?P<unit>{_UNIT})?\s*$")
+# "HbA1c 5.3 % 4.00 - 5.60" and "Estimated average glucose (eAG) 105 mg/dL"
+_NAME_VALUE_UNIT = re.compile(
+    rf"^(?P<name>[A-Za-z][^|]*?)\s+(?P<value>{NUMBER})\s*(?P<unit>{_UNIT})(?:\s+{_RANGE})?\s*$"
+)
+# "280.00 pg/mL 211.00 - 911.00" under a "VITAMIN B12; ..." heading
+_VALUE_UNIT_RANGE = re.compile(rf"^\s*(?P<value>{NUMBER})\s*(?P<unit>{_UNIT})\s+{_RANGE}\s*$")
+# "(Photometry)", "(Electrical Impedence)" method lines between a name and its values
+_METHOD = re.compile(r"^\s*\(.*\)\s*$")
+_NAME_LINE = re.compile(r"^[A-Za-z][A-Za-z0-9 ,;:&()/\-.']*$")
+
+# A value with a unit or a reference range ("15.00 g/dL", "13.00 - 17.00"): a cheap sign of a lab table
+_LAB_SIGNAL = re.compile(rf"{NUMBER}\s*{_UNIT}|{NUMBER}\s*-\s*{NUMBER}")
+
+_IGNORED_NAME_LINES = ("Test Name", "Test Report", "Report Status", "Note", "Notes", "Interpretation", "Comments")
+
+
+def _bounds(match):
+    """Returns (low, high) for a matched reference range, NaN for an open end."""
+    groups = match.groupdict()
+    if groups.get("low") is not None:
+        return float(groups["low"]), float(groups["high"])
+    if groups.get("lt") is not None:
+        return np.nan, float(groups["lt"])
+    if groups.get("gt") is not None:
+        return float(groups["gt"]), np.nan
+    return np.nan, np.nan
+
+
+def _clean_name(name: str) -> str:
+    # Drop a method glued onto the name ("Globulin(Calculated)") but keep abbreviations ("AST (SGOT)")
+    return re.sub(r"\s+", " ", re.sub(r"(?<=\S)\([^()]*\)\s*$", "", name)).strip(" ,;:")
+
+
+def has_lab_values(text: str, min_signals: int = 3) -> bool:
+    """True if the text looks like it contains lab results (used to skip cover, notes and scanned pages)."""
+    count = 0
+    for _ in _LAB_SIGNAL.finditer(text):
+        count += 1
+        if count >= min_signals:
+            return True
+    return False
+
+
+class BiomarkerTable:
+    """Columnar table of biomarkers: parallel name/unit lists and float arrays for value/low/high."""
+
+    def __init__(self, names, values, units, lows, highs):
+        self.names = list(names)
+        self.units = list(units)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def flags(self) -> np.ndarray:
+        """Flags every row in one vectorized pass: "LOW", "HIGH" or "" (in range / no range)."""
+        low = self.values < np.nan_to_num(self.lows, nan=-np.inf)
+        high = self.values > np.nan_to_num(self.highs, nan=np.inf)
+        return np.where(low, "LOW", np.where(high, "HIGH", ""))
+
+    def out_of_range(self) -> "BiomarkerTable":
+        mask = self.flags() != ""
+        return self._take(np.flatnonzero(mask))
+
+    def _take(self, idx) -> "BiomarkerTable":
+        return BiomarkerTable(
+            [self.names[i] for i in idx], self.values[idx], [self.units[i] for i in idx],
+            self.lows[idx], self.highs[idx],
+        )
+
+    def to_records(self):
+        flags = self.flags()
+        return [
+            {
+                "name": self.names[i],
+                "value": float(self.values[i]),
+                "unit": self.units[i],
+                "low": None if np.isnan(self.lows[i]) else float(self.lows[i]),
+                "high": None if np.isnan(self.highs[i]) else float(self.highs[i]),
+                "flag": str(flags[i]),
+            }
+            for i in range(len(self))
+        ]
+
+    def to_prompt(self) -> str:
+        """Compact pipe-separated table for the LLM, out-of-range rows first."""
+        flags = self.flags()
+        order = np.argsort(flags == "", kind="stable")
+        lines = ["name|value|unit|ref_range|flag"]
+        for i in order:
+            low, high = self.lows[i], self.highs[i]
+            if np.isnan(low) and np.isnan(high):
+                ref = ""
+            elif np.isnan(low):
+                ref = f"<{high:g}"
+            elif np.isnan(high):
+                ref = f">{low:g}"
+            else:
+                ref = f"{low:g}-{high:g}"
+            lines.append(f"{self.names[i]}|{self.values[i]:g}|{self.units[i]}|{ref}|{flags[i]}")
+        return "\n".join(lines)
+
+
+def extract_biomarkers(report_text: str) -> BiomarkerTable:
+    """Parses lab table rows out of report text. Rows repeated across pages are kept once."""
+    names, values, units, lows, highs = [], [], [], [], []
+    seen = set()
+    pending_name = None  # last name-like line, used by rows that carry no name themselves
+    open_row = None  # (name, value) from a _VALUE_NAME line still waiting for its range line
+
+    def add(name, value, unit, low, high):
+        name = _clean_name(name or "")
+        if not name:
+            return
+        key = (name.lower(), value)
+        if key in seen:
+            return
+        seen.add(key)
+        names.append(name)
+        values.append(value)
+        units.append(unit or "")
+        lows.append(low)
+        highs.append(high)
+
+    def close_open_row():
+        nonlocal open_row
+        if open_row is not None:
+            add(open_row[0], open_row[1], "", np.nan, np.nan)
+            open_row = None
+
+    for raw_line in report_text.splitlines():
+        line = raw_line.rstrip()
+        if not line.strip() or "|" in line:
+            continue
+        if _METHOD.match(line):
+            continue
+
+        if open_row is not None:
+            match = _RANGE_ONLY.match(line)
+            if match:
+                low, high = _bounds(match)
+                add(open_row[0], open_row[1], match.group("unit"), low, high)
+                open_row = None
+                continue
+            close_open_row()
+
+        match = _RANGE_UNIT_VALUE.match(line)
+        if match:
+            low, high = _bounds(match)
+            add(match.group("name") or pending_name, float(match.group("value")), match.group("unit"), low, high)
+            if not match.group("name"):
+                pending_name = None
+            continue
+
+        match = _VALUE_NAME.match(line)
+        if match:
+            if match.group("unit") or match.group("low") or match.group("lt") or match.group("gt"):
+                low, high = _bounds(match)
+                add(match.group("name"), float(match.group("value")), match.group("unit"), low, high)
+            else:
+                open_row = (match.group("name"), float(match.group("value")))
+            continue
+
+        match = _NAME_VALUE_UNIT.match(line)
+        if match:
+            low, high = _bounds(match)
+            add(match.group("name"), float(match.group("value")), match.group("unit"), low, high)
+            continue
+
+        match = _VALUE_UNIT_RANGE.match(line)
+        if match and pending_name:
+            low, high = _bounds(match)
+            add(pending_name, float(match.group("value")), match.group("unit"), low, high)
+            pending_name = None
+            continue
+
+        stripped = line.strip()
+        if _NAME_LINE.match(stripped) and not stripped.startswith(_IGNORED_NAME_LINES):
+            pending_name = stripped
+
+    close_open_row()
+    return BiomarkerTable(names, values, units, lows, highs)
+
+
+if __name__ == "__main__":
+    # Quick check against the sample reports: python biomarkers.py data/blood_test_report.pdf data/sample.pdf
+    import sys
+    from tools import extract_report_text
+
+    for path in sys.argv[1:] or ["data/blood_test_report.pdf", "data/sample.pdf"]:
+        table = extract_biomarkers(extract_report_text(path))
+        print(f"--- {path}: {len(table)} biomarkers, {len(table.out_of_range())} out of range ---")
+        print(table.to_prompt())
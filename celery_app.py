@@ -1,5 +1,6 @@
 from celery import Celery
-from config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from kombu import Exchange, Queue
+from config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND, INTERACTIVE_QUEUE, BATCH_QUEUE, DEDUPE_STALE_AFTER_SECONDS
 
 celery_app = Celery(
     'crew_worker',
@@ -10,4 +11,17 @@ celery_app = Celery(
 
 celery_app.conf.update(
     task_track_started=True,
+    # ADDED: Priority levels. Interactive and batch jobs have queues of their own (see scheduler.py)
+    task_queues=tuple(Queue(name, Exchange(name), routing_key=name) for name in (INTERACTIVE_QUEUE, BATCH_QUEUE)),
+    task_default_queue=INTERACTIVE_QUEUE,
+    broker_transport_options={
+        # Redis workers check the queues in the order above instead of round-robin,
+        # so a waiting interactive job is always taken before any batch job
+        "queue_order_strategy": "priority",
+        # With late acks an unfinished job is redelivered after this long
+        "visibility_timeout": DEDUPE_STALE_AFTER_SECONDS,
+    },
+    # A worker reserves only the job it is running, so it can't sit on batch jobs while interactive ones wait
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
 )
\ No newline at end of file
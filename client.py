@@ -1,11 +1,69 @@
+import hashlib
 import os
-from worker import run_crew_analysis
-from database import SessionLocal, AnalysisResult, JobStatus
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, AnalysisResult, AnalysisStep, JobStatus, DEFAULT_USER
+from scheduler import INTERACTIVE, BATCH, is_stale, check_backpressure, publish, dispatch
+from progress import get_pubsub, channel_name, step_to_event, TERMINAL_STATUSES
+from report_cache import file_sha256
+from config import DEDUPE_ENABLED
 
-def submit_analysis_job(query: str, file_path: str = "data/sample.pdf"):
+## Duplicate-job coalescing
+# A submission is identified by the user, the report's content hash and the normalized query.
+# While a job for that combination is queued, running or has succeeded, resubmissions get its task
+# ID back instead of starting another five-agent run. Users never share jobs: each one's results,
+# queue limits and batch share only ever count their own.
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split()).rstrip(" .?!")
+
+
+def job_hashes(file_path: str, query: str, user_id: str = DEFAULT_USER):
+    """Returns (content_hash, query_hash, dedupe_key) for a submission."""
+    content_hash = file_sha256(file_path)
+    query_hash = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+    return content_hash, query_hash, dedupe_key_for(content_hash, query_hash, user_id)
+
+
+def dedupe_key_for(content_hash: str, query_hash: str, user_id: str = DEFAULT_USER) -> str:
+    # The default user's keys keep their original form, so existing jobs still match
+    scope = "" if user_id == DEFAULT_USER else f"{user_id}:"
+    return hashlib.sha256(f"{scope}{content_hash}:{query_hash}".encode("utf-8")).hexdigest()
+
+
+def _find_reusable(db, dedupe_keys):
+    """Maps dedupe_key -> existing live job. Jobs that look abandoned release their key instead."""
+    records = db.query(AnalysisResult).filter(AnalysisResult.dedupe_key.in_(list(dedupe_keys))).all()
+    stale = [record for record in records if is_stale(record)]
+    if stale:
+        for record in stale:
+            record.dedupe_key = None
+        db.commit()
+    return {record.dedupe_key: record for record in records if record not in stale}
+
+
+def _report_reuse(record: AnalysisResult):
+    if record.status == JobStatus.SUCCESS:
+        print(f"♻️  Identical analysis already completed (Database Record ID: {record.id}), reusing its report.")
+    else:
+        print(f"♻️  Identical analysis already {record.status.value.lower()} (Database Record ID: {record.id}), attaching to it.")
+    print(f"   - Celery Task ID: {record.task_id}")
+
+
+def submit_analysis_job(query: str, file_path: str = "data/sample.pdf", force: bool = False,
+                        user_id: str = None, priority: str = INTERACTIVE):
     """
     Submits an analysis job to the Celery queue and creates a corresponding DB record.
+    If the same user already submitted the same report and query, the existing job's task ID is returned
+    instead (finished or still running); `force=True` always starts a new run.
+    Interactive jobs are published at once; "batch" jobs wait for the fair scheduler.
+    Returns None when the queue is over its backpressure limits.
     """
+    if priority not in (INTERACTIVE, BATCH):
+        raise ValueError(f"Unknown priority: {priority}")
+    user_id = user_id or DEFAULT_USER
     # Ensure the file exists before submitting
     if not os.path.exists(file_path):
         print(f"Error: File not found at {file_path}")
@@ -13,30 +71,72 @@ def submit_analysis_job(query: str, file_path: str = "data/sample.pdf"):
 
     db = SessionLocal()
     try:
-        # 1. Create a record in the database to track the job
+        content_hash, query_hash, dedupe_key = job_hashes(file_path, query, user_id)
+        if not DEDUPE_ENABLED or force:
+            dedupe_key = None
+        else:
+            existing = _find_reusable(db, [dedupe_key]).get(dedupe_key)
+            if existing is not None:
+                _report_reuse(existing)
+                return existing.task_id
+
+        refusal = check_backpressure(db, user_id, priority=priority)
+        if refusal:
+            print(f"❌ {refusal}")
+            return None
+
+        # 1. Create a record in the database to track the job.
+        # The Celery task ID is generated up front so the row is written once with its real ID.
+        # The unique dedupe_key makes this insert the atomic claim: of two identical submissions
+        # racing here, only one commits and the other attaches to it.
+        task_id = str(uuid.uuid4())
         new_analysis = AnalysisResult(
             file_path=file_path,
             query=query,
             status=JobStatus.PENDING,
-            task_id="temp" # Temporary task_id
+            task_id=task_id,
+            content_hash=content_hash,
+            query_hash=query_hash,
+            dedupe_key=dedupe_key,
+            user_id=user_id,
+            priority=priority,
+            # Batch jobs are dispatched later by the scheduler
+            dispatched_at=datetime.now(timezone.utc) if priority == INTERACTIVE else None,
         )
         db.add(new_analysis)
-        db.commit()
-        db.refresh(new_analysis)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            existing = _find_reusable(db, [dedupe_key]).get(dedupe_key) if dedupe_key else None
+            if existing is None:
+                raise
+            _report_reuse(existing)
+            return existing.task_id
         
-        # 2. Submit the job to the Celery queue
+        # 2. Submit the job to the Celery queue (its priority's queue)
         # Pass the database record ID to the worker
-        task = run_crew_analysis.delay(query=query, file_path=file_path, result_id=new_analysis.id)
-
-        # 3. Update the database record with the actual Celery task ID
-        new_analysis.task_id = task.id
-        db.commit()
+        if priority == BATCH:
+            dispatch(db)
+            print(f"✅ Job queued for batch processing!")
+            print(f"   - Database Record ID: {new_analysis.id}")
+            print(f"   - Celery Task ID: {task_id}")
+            return task_id
+        try:
+            publish(new_analysis)
+        except Exception:
+            # Release the claim so the next identical submission can try again
+            db.query(AnalysisResult).filter(AnalysisResult.id == new_analysis.id).update(
+                {"status": JobStatus.FAILURE, "dedupe_key": None, "final_report": "An error occurred: could not enqueue the job."}
+            )
+            db.commit()
+            raise
         
         print(f"✅ Job submitted successfully!")
         print(f"   - Database Record ID: {new_analysis.id}")
-        print(f"   - Celery Task ID: {task.id}")
+        print(f"   - Celery Task ID: {task_id}")
         
-        return task.id
+        return task_id
 
     except Exception as e:
         print(f"❌ Error submitting job: {str(e)}")
@@ -46,6 +146,230 @@ def submit_analysis_job(query: str, file_path: str = "data/sample.pdf"):
         db.close()
 
 
+def submit_batch(files, query: str, user_id: str = None):
+    """
+    Submits one analysis job per file in bulk: all DB records are inserted in a single transaction
+    as batch jobs, which the fair scheduler hands to Celery a few at a time (see scheduler.py).
+    Files whose report/query pair already has a live job (or repeats within the batch) reuse it.
+    Returns a list of Celery task IDs in the same order as `files` (None for files that were not found,
+    and for every file when the user is over their queued-jobs limit).
+    """
+    user_id = user_id or DEFAULT_USER
+    files = list(files)
+    found = [os.path.exists(file_path) for file_path in files]
+    for file_path, exists in zip(files, found):
+        if not exists:
+            print(f"Error: File not found at {file_path}")
+    valid_files = [file_path for file_path, exists in zip(files, found) if exists]
+    if not valid_files:
+        return [None] * len(files)
+
+    db = SessionLocal()
+    try:
+        hashes = [job_hashes(file_path, query, user_id) for file_path in valid_files]
+        existing = _find_reusable(db, {key for _, _, key in hashes}) if DEDUPE_ENABLED else {}
+        for record in existing.values():
+            _report_reuse(record)
+
+        # 1. Insert every new record in one transaction with pre-generated task IDs
+        records = []
+        assigned = [] # the record serving each valid file, new or reused
+        by_key = dict(existing)
+        for file_path, (content_hash, query_hash, dedupe_key) in zip(valid_files, hashes):
+            if DEDUPE_ENABLED and dedupe_key in by_key:
+                assigned.append(by_key[dedupe_key])
+                continue
+            record = AnalysisResult(
+                file_path=file_path,
+                query=query,
+                status=JobStatus.PENDING,
+                task_id=str(uuid.uuid4()),
+                content_hash=content_hash,
+                query_hash=query_hash,
+                dedupe_key=dedupe_key if DEDUPE_ENABLED else None,
+                user_id=user_id,
+                priority=BATCH,
+            )
+            records.append(record)
+            assigned.append(record)
+            by_key[dedupe_key] = record
+
+        refusal = check_backpressure(db, user_id, new_jobs=len(records), priority=BATCH) if records else None
+        if refusal:
+            print(f"❌ {refusal}")
+            return [None] * len(files)
+        db.add_all(records)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent submission claimed one of the keys; let the single-job path sort out each file
+            db.rollback()
+            print("Duplicate submission raced with this batch, submitting files one by one.")
+            task_ids = iter(submit_analysis_job(query, file_path, user_id=user_id, priority=BATCH) for file_path in valid_files)
+            return [next(task_ids) if exists else None for exists in found]
+
+        # 2. Release as many as the batch slots allow; finished jobs release the rest
+        # (a broker outage leaves them waiting in the database instead of failing them)
+        published = dispatch(db) if records else 0
+
+        print(f"✅ Batch submitted successfully! {len(records)} jobs queued ({published} dispatched now), {len(valid_files) - len(records)} reused.")
+        task_ids = iter(record.task_id for record in assigned)
+        return [next(task_ids) if exists else None for exists in found]
+
+    except Exception as e:
+        print(f"❌ Error submitting batch: {str(e)}")
+        db.rollback()
+        return [None] * len(files)
+    finally:
+        db.close()
+
+
+def resume_analysis_job(result_id: int):
+    """
+    Requeues a FAILURE job under the same database record, e.g. once an outage that outlasted the
+    automatic retries is over. The stages it had already finished are not run again.
+    Like a new submission it reclaims its dedupe key (attaching to the job that took the key in the
+    meantime, if any) and is subject to the same backpressure limits.
+    Returns the new Celery task ID (or the attached job's), or None if the job can't be resumed.
+    """
+    db = SessionLocal()
+    try:
+        record = db.get(AnalysisResult, result_id)
+        if record is None or record.status != JobStatus.FAILURE:
+            print(f"❌ Only failed jobs can be resumed (job {result_id}: {record.status if record else 'not found'}).")
+            return None
+        user_id = record.user_id or DEFAULT_USER
+        priority = record.priority or INTERACTIVE
+
+        dedupe_key = None
+        if DEDUPE_ENABLED and record.content_hash and record.query_hash:
+            dedupe_key = dedupe_key_for(record.content_hash, record.query_hash, user_id)
+            existing = _find_reusable(db, [dedupe_key]).get(dedupe_key)
+            if existing is not None:
+                _report_reuse(existing)
+                return existing.task_id
+
+        refusal = check_backpressure(db, user_id, priority=priority)
+        if refusal:
+            print(f"❌ {refusal}")
+            return None
+
+        record.status = JobStatus.PENDING
+        record.task_id = str(uuid.uuid4())
+        record.final_report = None
+        record.dedupe_key = dedupe_key
+        # Batch jobs get back in line with the scheduler
+        record.dispatched_at = datetime.now(timezone.utc) if priority == INTERACTIVE else None
+        try:
+            db.commit()
+        except IntegrityError:
+            # An identical submission claimed the key first
+            db.rollback()
+            existing = _find_reusable(db, [dedupe_key]).get(dedupe_key) if dedupe_key else None
+            if existing is None:
+                raise
+            _report_reuse(existing)
+            return existing.task_id
+
+        if priority == BATCH:
+            dispatch(db)
+        else:
+            try:
+                publish(record)
+            except Exception:
+                db.query(AnalysisResult).filter(AnalysisResult.id == result_id).update(
+                    {"status": JobStatus.FAILURE, "dedupe_key": None, "final_report": "An error occurred: could not enqueue the job."}
+                )
+                db.commit()
+                raise
+        print(f"✅ Job {result_id} resumed with Celery Task ID {record.task_id}")
+        return record.task_id
+    except Exception as e:
+        print(f"❌ Error resuming job {result_id}: {str(e)}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def poll_steps(result_id: int, after_step_id: int = 0, wait: float = 30.0, interval: float = 1.0):
+    """
+    Long-polls the analysis_steps table: returns step events newer than `after_step_id` as soon as
+    there are any (or the job has finished), waiting up to `wait` seconds.
+    Returns (events, status).
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        db = SessionLocal()
+        try:
+            steps = (
+                db.query(AnalysisStep)
+                .filter(AnalysisStep.result_id == result_id, AnalysisStep.id > after_step_id)
+                .order_by(AnalysisStep.id)
+                .all()
+            )
+            status = db.query(AnalysisResult.status).filter(AnalysisResult.id == result_id).scalar()
+            events = [step_to_event(step) for step in steps]
+        finally:
+            db.close()
+        status = status.value if status is not None else None
+        if events or status in TERMINAL_STATUSES or status is None or time.monotonic() >= deadline:
+            return events, status
+        time.sleep(interval)
+
+
+def watch_job(result_id: int, timeout: float = 3600.0):
+    """
+    Yields progress events for a job (one per finished stage, then a final status event).
+    Subscribes to the job's pub/sub channel; steps that finished before subscribing are replayed
+    from the database, and if pub/sub is unavailable it falls back to long-polling the database.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        subscription = get_pubsub().subscribe(channel_name(result_id))
+    except Exception as e:
+        print(f"Pub/sub unavailable ({e}), falling back to polling.")
+        subscription = None
+
+    seen_steps = set()
+    last_step_id = 0
+    try:
+        # Catch up on anything that finished before we subscribed
+        events, status = poll_steps(result_id, wait=0)
+        for event in events:
+            seen_steps.add(event["step_id"])
+            last_step_id = event["step_id"]
+            yield event
+        if status in TERMINAL_STATUSES:
+            yield {"event": "status", "result_id": result_id, "status": status}
+            return
+
+        while time.monotonic() < deadline:
+            if subscription is None:
+                events, status = poll_steps(result_id, after_step_id=last_step_id, wait=min(30.0, deadline - time.monotonic()))
+                for event in events:
+                    last_step_id = event["step_id"]
+                    yield event
+                if status in TERMINAL_STATUSES:
+                    yield {"event": "status", "result_id": result_id, "status": status}
+                    return
+                continue
+
+            event = subscription.get(timeout=min(30.0, max(0.0, deadline - time.monotonic())))
+            if event is None:
+                continue
+            if event["event"] == "step":
+                if event["step_id"] in seen_steps:
+                    continue
+                seen_steps.add(event["step_id"])
+            yield event
+            if event["event"] == "status" and event["status"] in TERMINAL_STATUSES:
+                return
+    finally:
+        if subscription is not None:
+            subscription.close()
+
+
 if __name__ == "__main__":
     # Set up your test PDF path
     test_pdf = "data/sample.pdf"  # Make sure this file exists
@@ -60,4 +384,16 @@ if __name__ == "__main__":
 
     if task_id:
         print("\nYour request is being processed in the background.")
-        print("You can monitor the status by checking the 'analysis_results' table in your database.")
\ No newline at end of file
+        if "--watch" in sys.argv:
+            db = SessionLocal()
+            try:
+                result_id = db.query(AnalysisResult.id).filter(AnalysisResult.task_id == task_id).scalar()
+            finally:
+                db.close()
+            for event in watch_job(result_id):
+                if event["event"] == "step":
+                    print(f"\n--- Stage finished: {event['step']} ({event['agent']}) ---\n{event['output']}")
+                else:
+                    print(f"\n--- Job status: {event['status']} ---")
+        else:
+            print("Run with --watch to follow each stage live, or check the 'analysis_results' table in your database.")
\ No newline at end of file
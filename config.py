@@ -1,6 +1,6 @@
 import os
+import threading
 from dotenv import load_dotenv
-from crewai import LLM
 
 load_dotenv()
 
@@ -10,8 +10,124 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///analysis_results.db")
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
 
+# --- Database tuning. Pool settings apply to server databases, WAL/busy timeout to SQLite ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+# Reports longer than this many characters are stored zlib-compressed in the analysis_reports table
+REPORT_INLINE_MAX_CHARS = int(os.getenv("REPORT_INLINE_MAX_CHARS", "2048"))
+
+# --- Duplicate-job coalescing: identical report + query reuses the existing job ---
+DEDUPE_ENABLED = os.getenv("DEDUPE_ENABLED", "true").lower() == "true"
+# An in-flight job not updated for this long is assumed dead: it no longer absorbs duplicates
+# or holds a batch slot, and the broker redelivers it if it was never acknowledged
+DEDUPE_STALE_AFTER_SECONDS = int(os.getenv("DEDUPE_STALE_AFTER_SECONDS", "7200"))
+
+# --- Scheduling (scheduler.py): interactive jobs get a queue of their own that workers check first,
+# batch jobs wait in the database and are released per user by weighted round-robin ---
+INTERACTIVE_QUEUE = os.getenv("INTERACTIVE_QUEUE", "interactive")
+BATCH_QUEUE = os.getenv("BATCH_QUEUE", "batch")
+# Batch jobs handed to Celery and not finished yet (0 = release everything at once)
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", "8"))
+# Share of the batch slots per user, e.g. "tenant-a=3,tenant-b=1"; other users get DEFAULT_USER_WEIGHT
+USER_WEIGHTS = os.getenv("USER_WEIGHTS", "")
+DEFAULT_USER_WEIGHT = int(os.getenv("DEFAULT_USER_WEIGHT", "1"))
+# Backpressure: submissions are refused beyond this many queued jobs overall / per user (0 = no limit)
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "200"))
+MAX_QUEUED_JOBS_PER_USER = int(os.getenv("MAX_QUEUED_JOBS_PER_USER", "1000"))
+
+# --- Extracted report text cache (shared by all workers that mount the same directory) ---
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", ".cache/reports")
+REPORT_CACHE_MEMORY_ENTRIES = int(os.getenv("REPORT_CACHE_MEMORY_ENTRIES", "64"))
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "true").lower() == "true"
+
+# --- Streaming PDF ingestion for large reports (pdf_ingest.py) ---
+# PDFs with at least this many pages are read page by page, skipping pages without lab values (0 = always)
+PDF_STREAMING_MIN_PAGES = int(os.getenv("PDF_STREAMING_MIN_PAGES", "20"))
+# Character budget for a streamed report's text (0 = no limit)
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "120000"))
+# Leading pages always kept when streaming (patient details usually have no lab values)
+PDF_KEEP_FIRST_PAGES = int(os.getenv("PDF_KEEP_FIRST_PAGES", "1"))
+# Processes used to extract pages when streaming (0 or 1 = in the calling process)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0"))
+
+# --- Worker execution: "prefork" runs one job per Celery process, "async" runs up to
+# ASYNC_CONCURRENCY jobs per process on an event loop (async_worker.py; start Celery with --pool threads) ---
+WORKER_MODE = os.getenv("WORKER_MODE", "prefork")
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", "16"))
+
+# --- Resuming failed jobs: finished stages are checkpointed in analysis_steps and skipped on retry ---
+RESUME_FROM_CHECKPOINTS = os.getenv("RESUME_FROM_CHECKPOINTS", "true").lower() == "true"
+# Transient errors (timeouts, rate limits, 5xx) retry the job with exponential backoff and full jitter
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "3"))
+JOB_RETRY_BACKOFF_SECONDS = int(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "30"))
+JOB_RETRY_BACKOFF_MAX_SECONDS = int(os.getenv("JOB_RETRY_BACKOFF_MAX_SECONDS", "600"))
+
+# --- Document pre-check (document_check.py): clear-cut documents skip the verifier agent ---
+VERIFIER_FAST_PATH = os.getenv("VERIFIER_FAST_PATH", "true").lower() == "true"
+# Scores at or above ACCEPT skip the verifier, at or below REJECT fail the job; in between the agent decides
+VERIFIER_ACCEPT_SCORE = float(os.getenv("VERIFIER_ACCEPT_SCORE", "0.6"))
+VERIFIER_REJECT_SCORE = float(os.getenv("VERIFIER_REJECT_SCORE", "0.2"))
+# Below this much extracted text (e.g. a scanned, image-only PDF) the score means nothing and the agent decides
+VERIFIER_MIN_TEXT_CHARS = int(os.getenv("VERIFIER_MIN_TEXT_CHARS", "200"))
+
+# --- Crew execution: "parallel" runs independent tasks concurrently, "sequential" is the fallback ---
+CREW_PROCESS_MODE = os.getenv("CREW_PROCESS_MODE", "parallel")
+# "assembled" builds the final Markdown report locally (report_assembler.py),
+# "polished" runs the report_compiler agent for an LLM-edited report
+REPORT_MODE = os.getenv("REPORT_MODE", "assembled")
+
+# --- LLM response cache (SQLite). Set LLM_CACHE_ENABLED=false to bypass it entirely ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# --- Fleet-wide rate limits, shared by all workers through the broker's Redis ("memory" = per process) ---
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis")
+LLM_RPM = int(os.getenv("LLM_RPM", "15"))
+LLM_TPM = int(os.getenv("LLM_TPM", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+SEARCH_RPM = int(os.getenv("SEARCH_RPM", "60"))
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "4"))
+
+# --- Search result cache (SQLite, shared by workers using the same file). See search_cache.py ---
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", ".cache/search_cache.sqlite3")
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "20000"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
 ### Loading LLM
-shared_llm = LLM(
-    model="gemini/gemini-2.0-flash",
-    temperature=0.7,
-)
\ No newline at end of file
+# MODIFIED: The LLM is built on first use so importing config (e.g. from client.py) never loads crewai
+_shared_llm = None
+_shared_llm_lock = threading.Lock()
+
+def get_shared_llm():
+    global _shared_llm
+    with _shared_llm_lock:
+        if _shared_llm is None:
+            from llm_cache import CachedLLM, ResponseCache
+            from rate_limiter import get_limiter
+
+            # Responses are cached so reruns and duplicate reports skip the round trip
+            _shared_llm = CachedLLM(
+                model="gemini/gemini-2.0-flash",
+                temperature=0.7,
+                cache=ResponseCache(
+                    LLM_CACHE_PATH,
+                    max_entries=LLM_CACHE_MAX_ENTRIES,
+                    ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                ) if LLM_CACHE_ENABLED else None,
+                # Every uncached call (agents and tool_llm alike) draws from the shared LLM quota
+                rate_limiter=get_limiter("llm"),
+            )
+        return _shared_llm
+
+def __getattr__(name):
+    # Keeps `from config import shared_llm` working while deferring construction to first access
+    if name == "shared_llm":
+        return get_shared_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -0,0 +1,165 @@
+## Builds the analysis crew from the task dependency graph
+# Tasks declare their inputs with `context=[...]` in task.py. We turn those declarations into a
+# DAG, group tasks into levels that only depend on earlier levels, and mark every task of a
+# multi-task level for async execution. CrewAI then starts the whole level at once and the next
+# synchronous task waits for it, so e.g. nutrition_analysis and exercise_planning run side by side.
+from concurrent.futures import wait
+from copy import copy
+
+from crewai import Crew, Process, Task
+from crewai.tasks.conditional_task import ConditionalTask
+from crewai.tasks.task_output import TaskOutput
+
+PARALLEL = "parallel"
+SEQUENTIAL = "sequential"
+
+
+class ParallelTask(Task):
+    """
+    A Task that is safe to run with async_execution. CrewAI runs an async task on a plain thread
+    that only ever sets its future's result, so an error there (an LLM timeout, say) would leave
+    the crew waiting on that future forever. Here the error is handed to the future instead and
+    the crew fails as it does for a synchronous task.
+    """
+
+    def _execute_task_async(self, agent, context, tools, future):
+        try:
+            future.set_result(self._execute_core(agent, context, tools))
+        except Exception as e:
+            future.set_exception(e)
+
+
+class ParallelCrew(Crew):
+    """
+    A Crew that waits for every task of a parallel level before reporting that one of them failed.
+    CrewAI gives up at the first failed future and leaves the siblings running; on a reused crew
+    template such a leftover task would finish during the next job and report its output there.
+    """
+
+    def _process_async_tasks(self, futures, was_replayed=False):
+        wait([future for _, future, _ in futures])
+        return super()._process_async_tasks(futures, was_replayed)
+
+    def _handle_conditional_task(self, task, task_outputs, futures, task_index, was_replayed):
+        # CrewAI collects the level's outputs into a local list here, so they never reach the crew
+        # output. A crew resumed at its last level (see `skip`) would then end with only the join's
+        # empty output and fail; keep them.
+        if futures:
+            task_outputs.extend(self._process_async_tasks(futures, was_replayed))
+            futures.clear()
+        return super()._handle_conditional_task(task, task_outputs, futures, task_index, was_replayed)
+
+
+def task_dependencies(tasks) -> dict:
+    """Maps id(task) -> list of tasks it depends on, restricted to the given tasks."""
+    members = {id(task) for task in tasks}
+    return {
+        id(task): [dep for dep in task.context if id(dep) in members] if isinstance(task.context, list) else []
+        for task in tasks
+    }
+
+
+def execution_levels(tasks) -> list:
+    """
+    Groups tasks into levels (Kahn's algorithm). Every task in a level depends only on tasks in
+    earlier levels; within a level the declaration order from `tasks` is kept.
+    """
+    deps = task_dependencies(tasks)
+    done = set()
+    remaining = list(tasks)
+    levels = []
+    while remaining:
+        level = [task for task in remaining if all(id(dep) in done for dep in deps[id(task)])]
+        if not level:
+            raise ValueError("Task context dependencies contain a cycle: " + ", ".join(t.description[:40] for t in remaining))
+        levels.append(level)
+        done.update(id(task) for task in level)
+        remaining = [task for task in remaining if id(task) not in done]
+    return levels
+
+
+def clone_tasks(tasks, agents) -> list:
+    """
+    Copies tasks (and the context links between them) so the module-level definitions in task.py
+    are never mutated by a crew run or by the async flags set here. Plain tasks are copied as
+    ParallelTask, otherwise the copy is the one Task.copy makes.
+    """
+    by_role = {agent.role: agent for agent in agents}
+    mapping = {}
+    clones = []
+    for task in tasks:
+        cls = ParallelTask if type(task) is Task else type(task)
+        clone = cls(
+            **task.model_dump(exclude={"id", "agent", "context", "tools"}, exclude_none=True),
+            context=[mapping[dep.key] for dep in task.context] if isinstance(task.context, list) else None,
+            agent=by_role.get(task.agent.role) if task.agent is not None else None,
+            tools=copy(task.tools) if task.tools else [],
+        )
+        mapping[task.key] = clone
+        clones.append(clone)
+    return clones
+
+
+def join_barrier(level) -> ConditionalTask:
+    """
+    A final task that never runs. CrewAI waits for all pending async tasks before evaluating a
+    conditional task, so appending this lets the last level run concurrently too (a crew may not
+    end with several async tasks). Its skipped output is empty and so ignored in the crew output.
+    """
+    return ConditionalTask(
+        name="join",
+        description="Wait for: " + ", ".join(task.name or task.description[:40] for task in level),
+        expected_output="Nothing, this task is always skipped.",
+        agent=level[-1].agent,
+        condition=lambda output: False,
+    )
+
+
+def build_crew(agents, tasks, process_mode: str = PARALLEL, skip=(), **crew_kwargs) -> Crew:
+    """
+    Assembles a Crew for `tasks` (given in a valid sequential order).
+    In parallel mode independent tasks are reordered by level and run concurrently;
+    sequential mode keeps the one-after-the-other behaviour as a fallback.
+    Tasks named in `skip` are left out; give them an output with `prefill_outputs` before kickoff.
+    """
+    if process_mode not in (PARALLEL, SEQUENTIAL):
+        raise ValueError(f"Unknown crew process mode: {process_mode}")
+
+    tasks = clone_tasks(tasks, agents)
+    # Skipped clones stay reachable through the context of the tasks that depend on them
+    tasks = [task for task in tasks if task.name not in skip]
+    if process_mode == PARALLEL:
+        ordered = []
+        levels = execution_levels(tasks)
+        for level in levels:
+            # Tasks sharing an agent would share its executor, so only fan out levels with distinct agents.
+            roles = {task.agent.role for task in level if task.agent is not None}
+            if len(level) > 1 and len(roles) == len(level):
+                for task in level:
+                    task.async_execution = True
+            ordered.extend(level)
+        if ordered[-1].async_execution:
+            ordered.append(join_barrier(levels[-1]))
+        tasks = ordered
+
+    return ParallelCrew(agents=agents, tasks=tasks, process=Process.sequential, **crew_kwargs)
+
+
+def prefill_outputs(crew, outputs: dict) -> list:
+    """
+    Sets the output of context tasks that are not part of the crew (see `skip`) from `outputs`,
+    keyed by task name, so the tasks depending on them get it as context. Returns those tasks.
+    """
+    members = {id(task) for task in crew.tasks}
+    filled = {}
+    for task in crew.tasks:
+        for dep in task.context if isinstance(task.context, list) else []:
+            if id(dep) not in members and dep.name in outputs:
+                dep.output = TaskOutput(
+                    name=dep.name,
+                    description=dep.description,
+                    raw=outputs[dep.name],
+                    agent=dep.agent.role if dep.agent is not None else "",
+                )
+                filled[id(dep)] = dep
+    return list(filled.values())
@@ -1,9 +1,21 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Enum as SQLAlchemyEnum
+import zlib
+from sqlalchemy import (
+    create_engine, event, inspect, select, Column, Integer, Float, String, Text, DateTime, LargeBinary, ForeignKey, Index,
+    Enum as SQLAlchemyEnum,
+)
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.sql import func
 import enum
-from config import DATABASE_URL
+from config import (
+    DATABASE_URL,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    SQLITE_WAL, SQLITE_BUSY_TIMEOUT_MS,
+    REPORT_INLINE_MAX_CHARS,
+)
+
+DEFAULT_USER = "default_user"
 
 # Define an enum for the status
 class JobStatus(enum.Enum):
@@ -12,8 +24,42 @@ class JobStatus(enum.Enum):
     SUCCESS = "SUCCESS"
     FAILURE = "FAILURE"
 
+# MODIFIED: Engine options depend on the backend.
+# SQLite files get WAL (readers no longer block the writer) and a busy timeout so concurrent
+# workers wait for the write lock instead of failing with "database is locked".
+# Server databases get a sized, pre-pinged, recycled connection pool.
+def _engine_kwargs(url) -> dict:
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite":
+        return {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    kwargs = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000, "check_same_thread": False}}
+    if url.database not in (None, "", ":memory:"):
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return kwargs
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        if SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Safe with WAL and avoids an fsync on every commit
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
 # SQLAlchemy setup
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _configure_sqlite)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -23,23 +69,191 @@ class AnalysisResult(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(String, unique=True, index=True, nullable=False)
-    user_id = Column(String, index=True, default="default_user") # Example user field
+    user_id = Column(String, index=True, default=DEFAULT_USER) # Example user field
     file_path = Column(String, nullable=False)
     query = Column(Text, nullable=False)
     status = Column(SQLAlchemyEnum(JobStatus), default=JobStatus.PENDING)
+    # Short reports and error messages only; long reports live compressed in analysis_reports
     final_report = Column(Text, nullable=True)
+    # ADDED: Duplicate-job coalescing. dedupe_key is set while a job is PENDING/RUNNING/SUCCESS
+    # and cleared on FAILURE, so the unique index lets exactly one live job own a (user, report, query) combination.
+    content_hash = Column(String(64), index=True, nullable=True)
+    query_hash = Column(String(64), nullable=True)
+    dedupe_key = Column(String(64), unique=True, index=True, nullable=True)
+    # ADDED: Scheduling (scheduler.py). "interactive" jobs are published at once, "batch" jobs wait
+    # with dispatched_at NULL until the fair scheduler hands them to Celery. NULL means interactive.
+    priority = Column(String(16), nullable=True)
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # ADDED: Composite indexes for listing a user's jobs by status and for status-wide scans
+    __table_args__ = (
+        Index("ix_analysis_results_user_status_created", "user_id", "status", "created_at"),
+        Index("ix_analysis_results_status_created", "status", "created_at"),
+        Index("ix_analysis_results_priority_status_dispatched", "priority", "status", "dispatched_at"),
+    )
+
     def __repr__(self):
         return f"<AnalysisResult(id={self.id}, task_id='{self.task_id}', status='{self.status}')>"
 
+# ADDED: Side table for large final reports, zlib-compressed, so the hot analysis_results row stays small
+class AnalysisReport(Base):
+    __tablename__ = "analysis_reports"
+
+    result_id = Column(Integer, ForeignKey("analysis_results.id"), primary_key=True)
+    encoding = Column(String, nullable=False, default="zlib")
+    size = Column(Integer, nullable=False) # Uncompressed size in bytes
+    content = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<AnalysisReport(result_id={self.result_id}, size={self.size}, stored={len(self.content)})>"
+
+# ADDED: One row per finished crew task, written as soon as the task completes
+class AnalysisStep(Base):
+    __tablename__ = "analysis_steps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    result_id = Column(Integer, ForeignKey("analysis_results.id"), index=True, nullable=False)
+    step_name = Column(String, nullable=False)
+    agent = Column(String, nullable=True)
+    output = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<AnalysisStep(id={self.id}, result_id={self.result_id}, step_name='{self.step_name}')>"
+
+# ADDED: Per-job instrumentation, one row per (scope, name): the whole job, each task, agent and tool
+class AnalysisMetric(Base):
+    __tablename__ = "analysis_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    result_id = Column(Integer, ForeignKey("analysis_results.id"), index=True, nullable=False)
+    scope = Column(String, nullable=False) # "job", "task", "agent" or "tool"
+    name = Column(String, nullable=False)
+    calls = Column(Integer, nullable=False, default=0) # task/tool runs
+    wall_seconds = Column(Float, nullable=False, default=0.0)
+    llm_calls = Column(Integer, nullable=False, default=0)
+    llm_seconds = Column(Float, nullable=False, default=0.0)
+    llm_cache_hits = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    retries = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<AnalysisMetric(result_id={self.result_id}, scope='{self.scope}', name='{self.name}')>"
+
+## Final report storage
+def set_final_report(db, result_id: int, report: str):
+    """
+    Stores `report` for a result: inline when short, otherwise compressed in analysis_reports.
+    Adds the changes to the session; the caller commits (typically together with the status update).
+    """
+    stored = db.get(AnalysisReport, result_id)
+    if report is None or len(report) <= REPORT_INLINE_MAX_CHARS:
+        if stored is not None:
+            db.delete(stored)
+        inline = report
+    else:
+        data = report.encode("utf-8")
+        if stored is None:
+            stored = AnalysisReport(result_id=result_id)
+            db.add(stored)
+        stored.encoding = "zlib"
+        stored.size = len(data)
+        stored.content = zlib.compress(data, 6)
+        inline = None
+    db.query(AnalysisResult).filter(AnalysisResult.id == result_id).update({"final_report": inline})
+
+
+def get_final_report(db, result_id: int):
+    """Returns the full final report (or error message) for a result, or None if there is none yet."""
+    inline = db.execute(select(AnalysisResult.final_report).where(AnalysisResult.id == result_id)).scalar()
+    if inline is not None:
+        return inline
+    stored = db.execute(
+        select(AnalysisReport.encoding, AnalysisReport.content).where(AnalysisReport.result_id == result_id)
+    ).first()
+    if stored is None:
+        return None
+    if stored.encoding != "zlib":
+        raise ValueError(f"Unknown report encoding for result {result_id}: {stored.encoding}")
+    return zlib.decompress(stored.content).decode("utf-8")
+
+## Paged / streaming listing. Only summary columns are selected, reports are never loaded.
+SUMMARY_COLUMNS = (
+    AnalysisResult.id,
+    AnalysisResult.task_id,
+    AnalysisResult.user_id,
+    AnalysisResult.file_path,
+    AnalysisResult.status,
+    AnalysisResult.created_at,
+    AnalysisResult.updated_at,
+)
+
+
+def _summary_query(user_id=None, status=None, since=None):
+    query = select(*SUMMARY_COLUMNS)
+    if user_id is not None:
+        query = query.where(AnalysisResult.user_id == user_id)
+    if status is not None:
+        query = query.where(AnalysisResult.status == status)
+    if since is not None:
+        query = query.where(AnalysisResult.created_at >= since)
+    return query
+
+
+def list_results(db, user_id: str = None, status: JobStatus = None, since=None, limit: int = 50, cursor: int = None):
+    """
+    Returns one page of result summaries, newest first, as (rows, next_cursor).
+    Pages are keyed on the primary key rather than OFFSET, so each page costs the same however deep
+    it is; pass `next_cursor` back as `cursor` for the following page (None means no more pages).
+    """
+    query = _summary_query(user_id, status, since)
+    if cursor is not None:
+        query = query.where(AnalysisResult.id < cursor)
+    rows = db.execute(query.order_by(AnalysisResult.id.desc()).limit(limit + 1)).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def iter_results(db, user_id: str = None, status: JobStatus = None, since=None, batch_size: int = 500):
+    """Streams every matching result summary, oldest first, fetching `batch_size` rows at a time."""
+    query = _summary_query(user_id, status, since).order_by(AnalysisResult.id)
+    for row in db.execute(query.execution_options(yield_per=batch_size)):
+        yield row
+
+def _add_missing_columns():
+    """Adds nullable columns introduced after a table was first created (create_all never alters tables)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                    print(f"Added column {table.name}.{column.name}")
+
 # Function to create the table
 def init_db():
     print("Initializing the database...")
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # create_all skips indexes on tables that already exist, so add any new ones explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     print("Database initialized.")
 
 # Run this once to create your database table
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
@@ -0,0 +1,87 @@
+## Deterministic pre-check of uploaded documents before the verifier agent
+# The verification task sends a whole LLM agent to decide whether a PDF looks like a medical
+# report. Most inputs are clear-cut: a lab report is full of test names, units and reference
+# ranges, a CV or an invoice has almost none. The document's text is scored on those signals and
+# only documents in the ambiguous middle band still go to the verifier agent.
+import re
+
+from biomarkers import UNITS, NUMBER
+
+ACCEPT = "accept"
+REJECT = "reject"
+AMBIGUOUS = "ambiguous"
+
+# Terms found on lab reports; each distinct one counts once
+LAB_KEYWORDS = (
+    "haemoglobin", "hemoglobin", "hematocrit", "platelet", "leucocyte", "leukocyte", "neutrophils",
+    "lymphocytes", "erythrocyte", "cholesterol", "triglycerides", "hdl", "ldl", "glucose", "hba1c",
+    "creatinine", "urea", "bilirubin", "albumin", "sgot", "sgpt", "thyroid", "tsh", "vitamin",
+    "sodium", "potassium", "calcium", "iron", "ferritin", "uric acid",
+    "reference range", "reference interval", "biological ref", "test name", "specimen", "sample collected",
+    "pathology", "laboratory", "patient", "units",
+)
+_KEYWORDS = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in LAB_KEYWORDS) + r")\b", re.IGNORECASE)
+_UNIT_VALUE = re.compile(rf"{NUMBER}\s*(?:" + "|".join(re.escape(u) for u in UNITS) + ")")
+_REFERENCE_RANGE = re.compile(rf"{NUMBER}\s*-\s*{NUMBER}|[<>]\s*{NUMBER}")
+
+# (feature, weight, count at which the feature is saturated)
+_FEATURES = (
+    ("keywords", 0.35, 8),
+    ("units", 0.25, 10),
+    ("ranges", 0.2, 5),
+    ("table_density", 0.2, 0.1),
+)
+
+
+class DocumentScore:
+    """Feature counts for one document and the weighted 0-1 score built from them."""
+
+    def __init__(self, keywords: int, units: int, ranges: int, table_density: float, characters: int):
+        self.keywords = keywords
+        self.units = units
+        self.ranges = ranges
+        self.table_density = table_density
+        self.characters = characters
+        self.score = round(sum(weight * min(1.0, getattr(self, name) / full) for name, weight, full in _FEATURES), 3)
+
+    def decision(self, accept_at: float, reject_at: float, min_characters: int = 200) -> str:
+        """
+        ACCEPT, REJECT or AMBIGUOUS. With less than `min_characters` of text (a scanned report
+        without a text layer, say) the features can't tell a lab report from anything else.
+        """
+        if self.characters < min_characters:
+            return AMBIGUOUS
+        if self.score >= accept_at:
+            return ACCEPT
+        if self.score <= reject_at:
+            return REJECT
+        return AMBIGUOUS
+
+    def describe(self) -> str:
+        return (
+            f"{self.characters} characters of text, score {self.score:.2f}: {self.keywords} lab terms, {self.units} values with units, "
+            f"{self.ranges} reference ranges, {self.table_density:.0%} of lines with lab values"
+        )
+
+
+def score_document(text: str) -> DocumentScore:
+    """Scores report text on lab keywords, unit patterns, reference ranges and table density."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    keywords = {match.lower() for match in _KEYWORDS.findall(text)}
+    # Lab table rows carry a value with its unit; ranges alone also match dates and years
+    tabular = sum(1 for line in lines if _UNIT_VALUE.search(line))
+    return DocumentScore(
+        keywords=len(keywords),
+        units=len(_UNIT_VALUE.findall(text)),
+        ranges=len(_REFERENCE_RANGE.findall(text)),
+        table_density=tabular / len(lines) if lines else 0.0,
+        characters=len(text),
+    )
+
+
+def verification_summary(file_path: str, score: DocumentScore) -> str:
+    """Stands in for the verifier agent's output when the pre-check accepts a document."""
+    return (
+        f"The document at {file_path} has been verified and appears to be a blood test report suitable "
+        f"for analysis (automatic check, {score.describe()})."
+    )
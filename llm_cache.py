@@ -0,0 +1,180 @@
+## Persistent LLM response cache
+# Reruns, retries and duplicate reports send the exact same prompts again. Responses are stored
+# in SQLite keyed on (model, temperature, stop words, prompt hash), with a TTL and LRU eviction
+# once the table grows past `max_entries`. CachedLLM wraps crewai's LLM so agents and tools that
+# share `shared_llm` from config.py all go through it.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from crewai import LLM
+
+import metrics
+from rate_limiter import estimate_tokens
+
+_local = threading.local()
+
+
+@contextmanager
+def bypass():
+    """Skips the cache (no reads, no writes) for LLM calls made in this thread inside the block."""
+    previous = getattr(_local, "bypass", False)
+    _local.bypass = True
+    try:
+        yield
+    finally:
+        _local.bypass = previous
+
+
+def make_key(model: str, temperature, messages, stop=None) -> str:
+    payload = json.dumps(
+        {"model": model, "temperature": temperature, "stop": stop, "messages": messages},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed key/value cache with TTL, size-bounded LRU eviction and hit/miss counters."""
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: float = 7 * 24 * 3600, table: str = "llm_responses"):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, latency REAL NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{self.table}_last_used ON {self.table} (last_used)")
+
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across threads and forked workers
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str):
+        """Returns the cached response, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT response, latency, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[2] > self.ttl_seconds:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                conn.execute(f"UPDATE {self.table} SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += row[1]
+        return row[0]
+
+    def put(self, key: str, response: str, latency: float = 0.0):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, response, latency, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, response, latency, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        (count,) = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self) -> dict:
+        """In-process counters plus fleet-wide totals read from the cache file."""
+        with self._connect() as conn:
+            entries, total_hits, total_saved = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(hits * latency), 0) FROM {self.table}"
+            ).fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 2),
+                "entries": entries,
+                "total_hits": total_hits,
+                "total_saved_seconds": round(total_saved, 2),
+            }
+
+
+class CachedLLM(LLM):
+    """
+    crewai LLM whose plain-text completions are served from a ResponseCache when possible.
+    Calls that do reach the provider go through `rate_limiter` (see rate_limiter.py) if one is set.
+    """
+
+    def __init__(self, *args, cache: ResponseCache = None, rate_limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+
+    def _provider_call(self, messages, **kwargs):
+        started = time.perf_counter()
+        if self.rate_limiter is None:
+            response = super().call(messages, **kwargs)
+        else:
+            response = self.rate_limiter.call(
+                super().call, messages,
+                estimated_tokens=estimate_tokens(messages),
+                count_tokens=lambda response: estimate_tokens(response) if isinstance(response, str) else 0,
+                **kwargs,
+            )
+        metrics.record_llm_call(
+            estimate_tokens(messages),
+            estimate_tokens(response) if isinstance(response, str) else 0,
+            time.perf_counter() - started,
+        )
+        return response
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, **kwargs):
+        # Function-calling requests depend on live tool state, so they are never cached
+        if self.cache is None or tools or available_functions or getattr(_local, "bypass", False):
+            return self._provider_call(messages, tools=tools, callbacks=callbacks, available_functions=available_functions, **kwargs)
+
+        key = make_key(self.model, self.temperature, messages, self.stop)
+        cached = self.cache.get(key)
+        if cached is not None:
+            metrics.record_llm_call(0, 0, 0.0, cached=True)
+            return cached
+
+        started = time.perf_counter()
+        response = self._provider_call(messages, tools=tools, callbacks=callbacks, available_functions=available_functions, **kwargs)
+        if isinstance(response, str) and response:
+            self.cache.put(key, response, latency=time.perf_counter() - started)
+        return response
+
+
+if __name__ == "__main__":
+    # Prints cache statistics: python llm_cache.py
+    from config import LLM_CACHE_PATH
+
+    print(json.dumps(ResponseCache(LLM_CACHE_PATH).stats(), indent=2))
@@ -0,0 +1,250 @@
+## Per-job instrumentation of tasks, agents, tools and LLM calls
+# crewai's event bus reports task and tool start/finish on the thread doing the work (async tasks
+# get a thread of their own), so a thread-local scope knows which job, task, agent and tool any LLM
+# call or rate-limit retry belongs to. Counters are saved to analysis_metrics when the job ends and
+# can be dumped in Prometheus text format:
+#   python metrics.py            # print once
+#   python metrics.py --serve 9100   # serve on http://localhost:9100/metrics
+# Token counts use the same ~4 characters/token estimate as the rate limiter.
+import threading
+import time
+
+from sqlalchemy import func
+
+from database import SessionLocal, AnalysisMetric, AnalysisResult
+
+FIELDS = (
+    "calls", "wall_seconds", "llm_calls", "llm_seconds", "llm_cache_hits",
+    "prompt_tokens", "completion_tokens", "retries", "errors",
+)
+JOB_SCOPE = ("job", "analysis")
+
+_local = threading.local()
+_jobs_by_task = {} # id(task) -> (JobMetrics, task name) for every attached task
+_registry_lock = threading.Lock()
+_installed = False
+
+
+class _Scope:
+    """What the current thread is working on: one task of one job, and the tool it is running, if any."""
+
+    def __init__(self, job, task, task_name, agent):
+        self.job = job
+        self.task = task
+        self.task_name = task_name
+        self.agent = agent
+        self.tool = None
+        self.started = time.perf_counter()
+
+    def targets(self):
+        targets = [JOB_SCOPE, ("task", self.task_name), ("agent", self.agent)]
+        if self.tool is not None:
+            targets.append(("tool", self.tool))
+        return targets
+
+
+class JobMetrics:
+    """Counters for one analysis job, keyed by (scope, name)."""
+
+    def __init__(self, result_id: int):
+        self.result_id = result_id
+        self.started = time.perf_counter()
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def add(self, scope: str, name: str, **amounts):
+        with self._lock:
+            row = self.rows.setdefault((scope, name), dict.fromkeys(FIELDS, 0))
+            for field, amount in amounts.items():
+                row[field] += amount
+
+    def attach(self, tasks):
+        """Routes events of these tasks to this job until `detach` is called."""
+        _install()
+        with _registry_lock:
+            for task in tasks:
+                _jobs_by_task[id(task)] = (self, task.name or task.description[:60])
+
+    def detach(self, tasks):
+        with _registry_lock:
+            for task in tasks:
+                if _jobs_by_task.get(id(task), (None,))[0] is self:
+                    del _jobs_by_task[id(task)]
+
+    def save(self, failed: bool = False):
+        """Adds the job's wall time and writes every row to analysis_metrics. Never raises."""
+        self.add(*JOB_SCOPE, calls=1, wall_seconds=time.perf_counter() - self.started, errors=int(failed))
+        with self._lock:
+            rows = [
+                AnalysisMetric(result_id=self.result_id, scope=scope, name=name, **values)
+                for (scope, name), values in self.rows.items()
+            ]
+        db = SessionLocal()
+        try:
+            db.add_all(rows)
+            db.commit()
+        except Exception as e:
+            # Like progress events, metrics must never fail the analysis itself
+            db.rollback()
+            print(f"Warning: could not save metrics for result {self.result_id}: {e}")
+        finally:
+            db.close()
+
+
+## Hooks called from our own code
+def record_llm_call(prompt_tokens: int, completion_tokens: int, seconds: float, cached: bool = False):
+    """Called by CachedLLM for every completion, served from the cache or by the provider."""
+    scope = getattr(_local, "scope", None)
+    if scope is None:
+        return
+    for target in scope.targets():
+        scope.job.add(
+            *target,
+            llm_calls=0 if cached else 1,
+            llm_cache_hits=1 if cached else 0,
+            llm_seconds=seconds,
+            prompt_tokens=0 if cached else prompt_tokens,
+            completion_tokens=0 if cached else completion_tokens,
+        )
+
+
+def record_retry():
+    """Called by the rate limiter whenever a throttled call is retried."""
+    scope = getattr(_local, "scope", None)
+    if scope is None:
+        return
+    for target in scope.targets():
+        scope.job.add(*target, retries=1)
+
+
+## crewai event bus handlers
+def _on_task_started(source, event):
+    task = event.task or source
+    with _registry_lock:
+        entry = _jobs_by_task.get(id(task))
+    if entry is None:
+        return
+    job, task_name = entry
+    agent = task.agent.role if task.agent is not None else "none"
+    _local.scope = _Scope(job, task, task_name, agent)
+
+
+def _on_task_finished(source, event, failed=False):
+    scope = getattr(_local, "scope", None)
+    if scope is None or scope.task is not (event.task or source):
+        return
+    wall = time.perf_counter() - scope.started
+    for target in (("task", scope.task_name), ("agent", scope.agent)):
+        scope.job.add(*target, calls=1, wall_seconds=wall, errors=int(failed))
+    _local.scope = None
+
+
+def _on_tool_started(source, event):
+    scope = getattr(_local, "scope", None)
+    if scope is not None:
+        scope.tool = event.tool_name
+
+
+def _on_tool_finished(source, event, failed=False):
+    scope = getattr(_local, "scope", None)
+    if scope is None:
+        return
+    if failed:
+        scope.job.add("tool", event.tool_name, errors=1)
+    else:
+        wall = (event.finished_at - event.started_at).total_seconds()
+        scope.job.add("tool", event.tool_name, calls=1, wall_seconds=wall)
+    scope.tool = None
+
+
+def _install():
+    """Registers the event handlers once per process (crewai is only imported when a job runs)."""
+    global _installed
+    with _registry_lock:
+        if _installed:
+            return
+        from crewai.utilities.events import crewai_event_bus
+        from crewai.utilities.events.task_events import TaskStartedEvent, TaskCompletedEvent, TaskFailedEvent
+        from crewai.utilities.events.tool_usage_events import ToolUsageStartedEvent, ToolUsageFinishedEvent, ToolUsageErrorEvent
+
+        crewai_event_bus.register_handler(TaskStartedEvent, _on_task_started)
+        crewai_event_bus.register_handler(TaskCompletedEvent, _on_task_finished)
+        crewai_event_bus.register_handler(TaskFailedEvent, lambda source, event: _on_task_finished(source, event, failed=True))
+        crewai_event_bus.register_handler(ToolUsageStartedEvent, _on_tool_started)
+        crewai_event_bus.register_handler(ToolUsageFinishedEvent, _on_tool_finished)
+        crewai_event_bus.register_handler(ToolUsageErrorEvent, lambda source, event: _on_tool_finished(source, event, failed=True))
+        _installed = True
+
+
+## Prometheus text exposition
+_HELP = {
+    "calls": "Task or tool runs",
+    "wall_seconds": "Wall-clock time spent",
+    "llm_calls": "LLM completions sent to the provider",
+    "llm_seconds": "Time spent waiting for LLM completions",
+    "llm_cache_hits": "LLM completions served from the response cache",
+    "prompt_tokens": "Estimated prompt tokens sent to the provider",
+    "completion_tokens": "Estimated completion tokens received from the provider",
+    "retries": "Rate-limited calls that were retried",
+    "errors": "Failed task, tool or job runs",
+}
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def render_prometheus(db=None) -> str:
+    """Totals over all saved jobs per (scope, name), plus the number of jobs per status."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        totals = db.query(
+            AnalysisMetric.scope, AnalysisMetric.name, *(func.sum(getattr(AnalysisMetric, field)) for field in FIELDS)
+        ).group_by(AnalysisMetric.scope, AnalysisMetric.name).order_by(AnalysisMetric.scope, AnalysisMetric.name).all()
+        statuses = db.query(AnalysisResult.status, func.count(AnalysisResult.id)).group_by(AnalysisResult.status).all()
+    finally:
+        if own_session:
+            db.close()
+
+    lines = []
+    for index, field in enumerate(FIELDS):
+        metric = f"medical_crew_{field}_total"
+        lines.append(f"# HELP {metric} {_HELP[field]}")
+        lines.append(f"# TYPE {metric} counter")
+        for row in totals:
+            value = row[2 + index] or 0
+            lines.append(f'{metric}{{scope="{_label(row[0])}",name="{_label(row[1])}"}} {value:g}')
+    lines.append("# HELP medical_crew_jobs Analysis jobs by status")
+    lines.append("# TYPE medical_crew_jobs gauge")
+    for status, count in statuses:
+        lines.append(f'medical_crew_jobs{{status="{status.value if status is not None else "UNKNOWN"}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    print(f"Serving metrics on http://0.0.0.0:{port}/metrics")
+    ThreadingHTTPServer(("", port), MetricsHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--serve" in sys.argv:
+        serve(int(sys.argv[sys.argv.index("--serve") + 1]))
+    else:
+        print(render_prometheus(), end="")
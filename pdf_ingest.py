@@ -0,0 +1,104 @@
+## Streaming, page-parallel PDF ingestion for large reports
+# Loading a whole PDF before doing anything with it is fine for a 10-page lab report, but hospital
+# exports run to hundreds of pages of cover sheets, notes and scanned appendices. Here pages are
+# read one at a time with pypdf, pages without lab values are dropped as soon as they are read,
+# text extraction can be spread over a process pool, and reading stops once the output reaches a
+# character budget, so peak memory no longer grows with the document.
+# Page text is extracted exactly as PyPDFLoader does it (stripped `extract_text()`).
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+
+from pypdf import PdfReader
+
+from biomarkers import has_lab_values
+from report_cache import normalize_page
+
+
+def page_count(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def iter_pages(file_path: str):
+    """Yields (page index, text) one page at a time."""
+    reader = PdfReader(file_path)
+    for index, page in enumerate(reader.pages):
+        yield index, (page.extract_text() or "").strip()
+
+
+## Process pool extraction
+# Each worker process opens the PDF once and extracts the pages it is given by index
+_reader = None
+
+
+def _open_reader(file_path: str):
+    global _reader
+    _reader = PdfReader(file_path)
+
+
+def _extract_page(index: int):
+    return index, (_reader.pages[index].extract_text() or "").strip()
+
+
+def iter_pages_parallel(file_path: str, workers: int):
+    """
+    Like `iter_pages`, with extraction in `workers` processes. At most 2 pages per worker are in
+    flight, so results never pile up. Falls back to `iter_pages` where processes can't be started
+    (e.g. inside a daemonic Celery prefork child).
+    """
+    total = page_count(file_path)
+    window = 2 * workers
+    try:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_open_reader, initargs=(file_path,))
+        pending = [pool.submit(_extract_page, index) for index in range(min(window, total))]
+    except Exception as e:
+        print(f"Warning: parallel PDF extraction unavailable ({e}), reading pages serially")
+        yield from iter_pages(file_path)
+        return
+    try:
+        for next_index in count(len(pending)):
+            if not pending:
+                break
+            yield pending.pop(0).result()
+            if next_index < total:
+                pending.append(pool.submit(_extract_page, next_index))
+    finally:
+        # Also runs when the consumer stops early (budget reached): drop the pages not yet read
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def stream_report_text(file_path: str, max_chars: int, workers: int = 0, keep_first_pages: int = 1) -> str:
+    """
+    Cleaned report text built page by page: the first `keep_first_pages` pages (patient details)
+    are always kept, later pages only if they contain lab values, and reading stops at `max_chars`
+    (0 = no limit). A closing note says what was left out.
+    """
+    pages = iter_pages_parallel(file_path, workers) if workers > 1 else iter_pages(file_path)
+    kept, used, skipped, truncated_at = [], 0, 0, None
+    try:
+        for index, text in pages:
+            if index >= keep_first_pages and not has_lab_values(text):
+                skipped += 1
+                continue
+            page = normalize_page(text) + "\n"
+            if max_chars and used + len(page) > max_chars:
+                kept.append(page[:max_chars - used])
+                truncated_at = index + 1
+                break
+            kept.append(page)
+            used += len(page)
+    finally:
+        pages.close()
+
+    notes = []
+    if skipped:
+        notes.append(f"{skipped} page(s) without lab results were skipped")
+    if truncated_at is not None:
+        notes.append(f"the report was cut off at page {truncated_at} to stay within {max_chars} characters")
+    if notes:
+        kept.append(f"\n[Note: {'; '.join(notes)}.]\n")
+    return "".join(kept)
+
+
+def ingest_signature(streaming_min_pages: int, max_chars: int, keep_first_pages: int) -> str:
+    """Settings that change the extracted text, for the report cache key (workers don't)."""
+    return f"stream{streaming_min_pages}-max{max_chars}-keep{keep_first_pages}"
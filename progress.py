@@ -0,0 +1,173 @@
+## Live progress events for running analyses
+# Every finished crew task is written to the analysis_steps table and published on the
+# "analysis:<result_id>" pub/sub channel (Redis from the Celery broker, or an in-process stand-in),
+# so clients can show each stage's output as soon as it exists instead of waiting for the final report.
+import json
+import queue
+import threading
+
+from config import CELERY_BROKER_URL
+from database import SessionLocal, AnalysisStep, JobStatus
+
+TERMINAL_STATUSES = (JobStatus.SUCCESS.value, JobStatus.FAILURE.value)
+
+
+def channel_name(result_id: int) -> str:
+    return f"analysis:{result_id}"
+
+
+class InMemoryPubSub:
+    """Process-local pub/sub with the same interface as RedisPubSub (tests, eager mode)."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def subscribe(self, channel: str):
+        subscription = _InMemorySubscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(subscription._queue)
+        return subscription
+
+    def _unsubscribe(self, channel, q):
+        with self._lock:
+            if q in self._subscribers.get(channel, []):
+                self._subscribers[channel].remove(q)
+
+
+class _InMemorySubscription:
+    def __init__(self, pubsub, channel):
+        self._pubsub = pubsub
+        self._channel = channel
+        self._queue = queue.Queue()
+
+    def get(self, timeout: float = None):
+        """Returns the next message, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._pubsub._unsubscribe(self._channel, self._queue)
+
+
+class RedisPubSub:
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel: str, message: dict):
+        self._client.publish(channel, json.dumps(message))
+
+    def subscribe(self, channel: str):
+        return _RedisSubscription(self._client, channel)
+
+
+class _RedisSubscription:
+    def __init__(self, client, channel):
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(channel)
+
+    def get(self, timeout: float = None):
+        message = self._pubsub.get_message(timeout=timeout if timeout is not None else 3600)
+        if message is None:
+            return None
+        return json.loads(message["data"])
+
+    def close(self):
+        self._pubsub.close()
+
+
+_pubsub = None
+_pubsub_lock = threading.Lock()
+
+
+def get_pubsub():
+    global _pubsub
+    with _pubsub_lock:
+        if _pubsub is None:
+            if CELERY_BROKER_URL.startswith(("redis://", "rediss://")):
+                _pubsub = RedisPubSub(CELERY_BROKER_URL)
+            else:
+                _pubsub = InMemoryPubSub()
+        return _pubsub
+
+
+def step_to_event(step: AnalysisStep) -> dict:
+    return {
+        "event": "step",
+        "result_id": step.result_id,
+        "step_id": step.id,
+        "step": step.step_name,
+        "agent": step.agent,
+        "output": step.output,
+        "started_at": step.started_at.isoformat() if step.started_at else None,
+        "finished_at": step.finished_at.isoformat() if step.finished_at else None,
+    }
+
+
+def _publish(result_id: int, event: dict):
+    try:
+        get_pubsub().publish(channel_name(result_id), event)
+    except Exception as e:
+        # The analysis_steps table is the source of truth, a lost live event is only a UI delay
+        print(f"Warning: could not publish progress event for result {result_id}: {e}")
+
+
+class ProgressReporter:
+    """Per-job sink for crew task callbacks: persists each step, then publishes it."""
+
+    def __init__(self, result_id: int):
+        self.result_id = result_id
+
+    def task_completed(self, task, output):
+        """Bound per task as `task.callback`; crewai calls it with the TaskOutput when the task finishes."""
+        db = SessionLocal()
+        try:
+            step = AnalysisStep(
+                result_id=self.result_id,
+                step_name=task.name or task.description[:60],
+                agent=output.agent,
+                output=output.raw,
+                started_at=task.start_time,
+                finished_at=task.end_time,
+            )
+            db.add(step)
+            db.commit()
+            event = step_to_event(step)
+        except Exception as e:
+            # Progress reporting must never fail the analysis itself
+            db.rollback()
+            print(f"Warning: could not record step for result {self.result_id}: {e}")
+            return
+        finally:
+            db.close()
+        _publish(self.result_id, event)
+
+    def checkpoints(self) -> dict:
+        """Outputs of the tasks this job already finished (in an earlier attempt), keyed by step name."""
+        db = SessionLocal()
+        try:
+            steps = db.query(AnalysisStep.step_name, AnalysisStep.output).filter(
+                AnalysisStep.result_id == self.result_id
+            ).order_by(AnalysisStep.id).all()
+        finally:
+            db.close()
+        # The latest output wins if a step was recorded more than once
+        return {name: output for name, output in steps if output}
+
+    def status_changed(self, status: JobStatus, detail: str = None):
+        _publish(self.result_id, {"event": "status", "result_id": self.result_id, "status": status.value, "detail": detail})
+
+    def attach(self, tasks):
+        """Points every task's callback at this reporter for the duration of one job."""
+        for task in tasks:
+            task.callback = lambda output, task=task: self.task_completed(task, output)
@@ -0,0 +1,271 @@
+## Fleet-wide rate limiting for LLM and search calls
+# Each limiter budgets requests per minute and tokens per minute with two token buckets whose
+# state lives in the Celery broker's Redis, so every worker process draws from the same quota.
+# An in-process backend with identical semantics is used for tests and single-process runs.
+# On a 429 the limiter sets a shared cool-down and halves this process's concurrency (AIMD),
+# then grows it back one slot at a time as calls succeed.
+import random
+import threading
+import time
+
+import metrics
+from config import (
+    CELERY_BROKER_URL,
+    RATE_LIMIT_BACKEND,
+    LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY,
+    SEARCH_RPM, SEARCH_MAX_CONCURRENCY,
+)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call is still throttled after all retries."""
+
+
+def estimate_tokens(payload) -> int:
+    """Rough token count (~4 characters per token) used to reserve TPM budget before a call."""
+    if isinstance(payload, list):
+        payload = " ".join(str(message.get("content", "")) if isinstance(message, dict) else str(message) for message in payload)
+    return max(1, len(str(payload)) // 4)
+
+
+def _status_code(error: Exception):
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Recognises 429s from litellm/Gemini, requests/Serper and anything else carrying a status code."""
+    if type(error).__name__ in ("RateLimitError", "TooManyRequests"):
+        return True
+    if _status_code(error) == 429:
+        return True
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text or "resource_exhausted" in text
+
+
+# Provider and network errors worth retrying the whole job for (litellm, requests/urllib3, httpx)
+_TRANSIENT_ERRORS = (
+    "RateLimitError", "TooManyRequests",
+    "Timeout", "APITimeoutError", "ReadTimeout", "ConnectTimeout", "APIConnectionError", "ConnectionError",
+    "ServiceUnavailableError", "InternalServerError", "BadGatewayError",
+)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Rate limits, timeouts, connection failures and 5xx responses, also when wrapped in another exception.
+    Only exception types and status codes count, never the message: any error text may contain "429".
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (RateLimitExceeded, TimeoutError, ConnectionError)):
+            return True
+        if any(cls.__name__ in _TRANSIENT_ERRORS for cls in type(error).__mro__):
+            return True
+        status = _status_code(error)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _refill(level, updated_at, now, capacity, rate):
+    if level is None:
+        return float(capacity)
+    return min(float(capacity), level + (now - updated_at) * rate)
+
+
+class InMemoryBackend:
+    """Bucket state in a dict guarded by a lock. Shared by all threads of one process only."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._cooldowns = {}
+        self._lock = threading.Lock()
+
+    def take(self, name, now, rpm, tpm, requests, tokens, force=False) -> float:
+        """Takes `requests`/`tokens` from both buckets, or returns how many seconds to wait."""
+        with self._lock:
+            cooldown = self._cooldowns.get(name, 0.0)
+            if not force and cooldown > now:
+                return cooldown - now
+            buckets = []
+            wait = 0.0
+            for suffix, capacity, amount in (("req", rpm, requests), ("tok", tpm, tokens)):
+                if not capacity:
+                    continue
+                rate = capacity / 60.0
+                level, updated_at = self._buckets.get(f"{name}:{suffix}", (None, now))
+                level = _refill(level, updated_at, now, capacity, rate)
+                needed = min(amount, capacity)
+                if level < needed:
+                    wait = max(wait, (needed - level) / rate)
+                buckets.append((f"{name}:{suffix}", level, amount))
+            if wait > 0 and not force:
+                return wait
+            for key, level, amount in buckets:
+                self._buckets[key] = (level - amount, now)
+            return 0.0
+
+    def cool_down(self, name, until):
+        with self._lock:
+            self._cooldowns[name] = max(self._cooldowns.get(name, 0.0), until)
+
+
+class RedisBackend:
+    """Bucket state in Redis (the Celery broker), updated atomically by a Lua script."""
+
+    TAKE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local force = ARGV[6] == '1'
+    local cooldown = tonumber(redis.call('GET', KEYS[3]) or '0')
+    if not force and cooldown > now then return tostring(cooldown - now) end
+    local specs = {{KEYS[1], tonumber(ARGV[2]), tonumber(ARGV[4])}, {KEYS[2], tonumber(ARGV[3]), tonumber(ARGV[5])}}
+    local levels = {}
+    local wait = 0
+    for i, spec in ipairs(specs) do
+      local capacity = spec[2]
+      if capacity > 0 then
+        local rate = capacity / 60.0
+        local state = redis.call('HMGET', spec[1], 'level', 'ts')
+        local level = tonumber(state[1])
+        if level == nil then level = capacity else level = math.min(capacity, level + (now - tonumber(state[2])) * rate) end
+        local needed = math.min(spec[3], capacity)
+        if level < needed then wait = math.max(wait, (needed - level) / rate) end
+        levels[i] = level
+      end
+    end
+    if wait > 0 and not force then return tostring(wait) end
+    for i, spec in ipairs(specs) do
+      if levels[i] ~= nil then
+        redis.call('HSET', spec[1], 'level', levels[i] - spec[3], 'ts', now)
+        redis.call('EXPIRE', spec[1], 120)
+      end
+    end
+    return '0'
+    """
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.TAKE_SCRIPT)
+
+    def take(self, name, now, rpm, tpm, requests, tokens, force=False) -> float:
+        keys = [f"ratelimit:{name}:req", f"ratelimit:{name}:tok", f"ratelimit:{name}:cooldown"]
+        args = [now, rpm or 0, tpm or 0, requests, tokens, "1" if force else "0"]
+        return float(self._take(keys=keys, args=args))
+
+    def cool_down(self, name, until):
+        key = f"ratelimit:{name}:cooldown"
+        current = float(self._client.get(key) or 0)
+        if until > current:
+            self._client.set(key, until, px=int(max(1.0, until - time.time()) * 1000) + 1000)
+
+
+class RateLimiter:
+    """Requests-per-minute + tokens-per-minute limiter with adaptive per-process concurrency."""
+
+    def __init__(self, name: str, rpm: int, tpm: int = 0, max_concurrency: int = 4, backend=None,
+                 max_retries: int = 5, base_backoff: float = 2.0):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, max_concurrency)
+        self.backend = backend or InMemoryBackend()
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.concurrency = self.max_concurrency
+        self.in_flight = 0
+        self.throttled = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def _enter(self):
+        with self._cond:
+            while self.in_flight >= self.concurrency:
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _exit(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def acquire(self, tokens: int = 1):
+        """Blocks until both buckets have budget for one request of `tokens` tokens."""
+        while True:
+            wait = self.backend.take(self.name, time.time(), self.rpm, self.tpm, 1, tokens)
+            if wait <= 0:
+                return
+            # Jitter so waiting workers don't all retry at the same instant
+            time.sleep(wait + random.uniform(0, 0.1))
+
+    def settle(self, extra_tokens: int):
+        """Charges tokens beyond the estimate (e.g. the completion) once the real usage is known."""
+        if extra_tokens > 0 and self.tpm:
+            self.backend.take(self.name, time.time(), self.rpm, self.tpm, 0, extra_tokens, force=True)
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self.concurrency < self.max_concurrency and self._successes >= self.concurrency:
+                self.concurrency += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_throttled(self, attempt: int):
+        with self._cond:
+            self.throttled += 1
+            self.concurrency = max(1, self.concurrency // 2)
+            self._successes = 0
+        backoff = self.base_backoff * (2 ** attempt)
+        self.backend.cool_down(self.name, time.time() + backoff)
+        metrics.record_retry()
+
+    def call(self, fn, *args, estimated_tokens: int = 1, count_tokens=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) within the budget, retrying 429s with shared exponential backoff.
+        `count_tokens(result)` may return the completion's token count to charge after the call.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._enter()
+            try:
+                self.acquire(estimated_tokens)
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    raise
+                self.on_throttled(attempt)
+                if attempt == self.max_retries:
+                    raise RateLimitExceeded(f"{self.name}: still rate limited after {attempt + 1} attempts") from e
+                continue
+            finally:
+                self._exit()
+            self.on_success()
+            if count_tokens is not None:
+                self.settle(count_tokens(result))
+            return result
+
+
+def _make_backend():
+    if RATE_LIMIT_BACKEND == "redis" and CELERY_BROKER_URL.startswith(("redis://", "rediss://")):
+        return RedisBackend(CELERY_BROKER_URL)
+    return InMemoryBackend()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """Returns the process-wide limiter for "llm" or "search" (state is shared fleet-wide via the backend)."""
+    with _limiters_lock:
+        if name not in _limiters:
+            if name == "llm":
+                _limiters[name] = RateLimiter("llm", LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY, _make_backend())
+            elif name == "search":
+                _limiters[name] = RateLimiter("search", SEARCH_RPM, 0, SEARCH_MAX_CONCURRENCY, _make_backend())
+            else:
+                raise ValueError(f"Unknown rate limiter: {name}")
+        return _limiters[name]
@@ -0,0 +1,198 @@
+## Deterministic assembly of the final report
+# compile_report_task used to send the doctor's, nutritionist's and fitness planner's outputs back
+# to an LLM just to put them under four headings and merge their disclaimers. In the default
+# "assembled" report mode we do that locally: sections in a fixed order, headings nested under
+# them, and every disclaimer moved into one deduplicated closing section.
+# The "polished" mode keeps the report_compiler agent for an LLM-edited report.
+import re
+
+ASSEMBLED = "assembled"
+POLISHED = "polished"
+
+TITLE = "Blood Test Report Analysis"
+# (task name, section heading) in report order
+SECTIONS = (
+    ("help_patients", "Blood Test Analysis"),
+    ("nutrition_analysis", "Nutritional Recommendations"),
+    ("exercise_planning", "Exercise Recommendations"),
+)
+DISCLAIMERS_HEADING = "Final Disclaimers"
+DEFAULT_DISCLAIMER = (
+    "This report was generated by AI for informational purposes only and is not a substitute for "
+    "professional medical advice, diagnosis or treatment. Always consult a qualified healthcare "
+    "professional before making changes to your diet, exercise routine or medication."
+)
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_DISCLAIMER_LABEL = re.compile(
+    r"^[\s>*_]*(?:important\s+)?(?:medical\s+)?disclaimers?\s*[*_]*\s*[:.\-–—]?\s*[*_]*\s*", re.IGNORECASE
+)
+# Phrases that only ever appear in disclaimers, so sentences containing them are moved
+_DISCLAIMER_PHRASES = (
+    "not intended as medical advice",
+    "not constitute medical advice",
+    "is not medical advice",
+    "for informational purposes only",
+    "for educational purposes only",
+)
+# Disclaimers only when the sentence also points to medical care: "Supplements are not a substitute
+# for a balanced diet" is advice and stays in its section
+_CARE_PHRASES = ("not a substitute for", "not a replacement for")
+_MEDICAL_CARE = re.compile(r"\b(?:medical|doctor|physician|clinician|professional|healthcare|health care provider)", re.IGNORECASE)
+_DISCLAIMER_START = re.compile(r"^[\s>*_]*(?:important\s+|medical\s+)*disclaimers?\b", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _blocks(text: str):
+    """Splits Markdown into paragraphs; every heading line is a block of its own."""
+    block = []
+    for line in text.replace("\r\n", "\n").split("\n"):
+        if not line.strip() or _HEADING.match(line):
+            if block:
+                yield "\n".join(block)
+                block = []
+            if line.strip():
+                yield line.strip()
+            continue
+        block.append(line.rstrip())
+    if block:
+        yield "\n".join(block)
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def _has_disclaimer_phrase(text: str) -> bool:
+    lowered = " ".join(text.lower().split())
+    if any(phrase in lowered for phrase in _DISCLAIMER_PHRASES):
+        return True
+    return any(phrase in lowered for phrase in _CARE_PHRASES) and _MEDICAL_CARE.search(lowered) is not None
+
+
+def _split_block(block: str):
+    """
+    Separates one paragraph into (body, disclaimer). A line starting with "Disclaimer" takes the
+    rest of the paragraph with it; otherwise only sentences with a disclaimer phrase are moved.
+    """
+    lines = block.split("\n")
+    for index, line in enumerate(lines):
+        if _DISCLAIMER_START.match(line):
+            return "\n".join(lines[:index]), " ".join(lines[index:])
+    body, moved = [], []
+    for line in lines:
+        sentences = _SENTENCE_END.split(line)
+        flagged = [sentence for sentence in sentences if _has_disclaimer_phrase(sentence)]
+        if not flagged:
+            body.append(line)
+            continue
+        moved.extend(flagged)
+        rest = " ".join(sentence for sentence in sentences if sentence not in flagged).strip()
+        if rest.strip("*_>- "):
+            body.append(rest)
+    return "\n".join(body), " ".join(moved)
+
+
+def split_disclaimers(text: str):
+    """Returns (body blocks, disclaimer texts) for one agent's output."""
+    body, disclaimers = [], []
+    disclaimer_level = None # set while inside a "Disclaimer" heading's section
+    for block in _blocks(text):
+        heading = _HEADING.match(block)
+        if heading:
+            level = len(heading.group(1))
+            if disclaimer_level is not None and level <= disclaimer_level:
+                disclaimer_level = None
+            if "disclaimer" in heading.group(2).lower():
+                disclaimer_level = level
+                continue
+        if heading:
+            body.append(block)
+            continue
+        if disclaimer_level is not None:
+            block, disclaimer = "", block
+        else:
+            block, disclaimer = _split_block(block)
+        cleaned = " ".join(_DISCLAIMER_LABEL.sub("", disclaimer).split()).strip(" *_")
+        if cleaned:
+            disclaimers.append(cleaned)
+        if block.strip():
+            body.append(block)
+    # Rules left dangling at either end once the disclaimers are gone
+    while body and _RULE.match(body[-1]):
+        body.pop()
+    while body and _RULE.match(body[0]):
+        body.pop(0)
+    return body, disclaimers
+
+
+def dedupe_disclaimers(disclaimers):
+    """
+    Drops disclaimers that repeat an earlier one: when at least 80% of the shorter one's words
+    appear in the other, only the fuller wording is kept (in the earlier one's position).
+    """
+    kept = []
+    for text in disclaimers:
+        words = _words(text)
+        if not words:
+            continue
+        for index, (other_text, other_words) in enumerate(kept):
+            shorter = min(len(words), len(other_words))
+            if len(words & other_words) >= 0.8 * shorter:
+                if len(words) > len(other_words):
+                    kept[index] = (text, words)
+                break
+        else:
+            kept.append((text, words))
+    return [text for text, _ in kept]
+
+
+def _nest_headings(body, title: str):
+    """Shifts headings so the section's own headings start at ###, and drops a leading title repeat."""
+    if body and _HEADING.match(body[0]):
+        first = _words(_HEADING.match(body[0]).group(2))
+        if first and (first <= _words(title) or _words(title) <= first):
+            body = body[1:]
+    levels = [len(_HEADING.match(block).group(1)) for block in body if _HEADING.match(block)]
+    if not levels:
+        return body
+    shift = 3 - min(levels)
+    nested = []
+    for block in body:
+        heading = _HEADING.match(block)
+        if heading:
+            block = "#" * min(6, len(heading.group(1)) + shift) + " " + heading.group(2)
+        nested.append(block)
+    return nested
+
+
+def assemble_report(outputs: dict, query: str = None) -> str:
+    """
+    Builds the final Markdown report from task outputs keyed by task name
+    ("help_patients", "nutrition_analysis", "exercise_planning"). Same input, same report.
+    """
+    parts = [f"# {TITLE}"]
+    if query:
+        parts.append(f"**Your question:** {' '.join(query.split())}")
+    disclaimers = []
+    for number, (task_name, heading) in enumerate(SECTIONS, start=1):
+        body, found = split_disclaimers(outputs.get(task_name) or "")
+        disclaimers.extend(found)
+        parts.append(f"## {number}. {heading}")
+        body = _nest_headings(body, heading)
+        parts.append("\n\n".join(body) if body else "_No output was produced for this section._")
+
+    parts.append(f"## {len(SECTIONS) + 1}. {DISCLAIMERS_HEADING}")
+    merged = dedupe_disclaimers([DEFAULT_DISCLAIMER] + disclaimers)
+    parts.append("\n".join(f"- {text}" for text in merged))
+    return "\n\n".join(parts) + "\n"
+
+
+def task_outputs(tasks) -> dict:
+    """
+    Maps task name -> raw output for every task of a finished crew that produced one.
+    (CrewOutput.tasks_output only keeps the outputs since the last async batch, so read the tasks.)
+    """
+    return {task.name: task.output.raw for task in tasks if task.name and task.output is not None and task.output.raw}
@@ -0,0 +1,116 @@
+## Content-addressed cache for extracted report text
+# The same PDF is read by several tasks in a single job (verification, help_patients, retries),
+# so we key the cleaned text on the SHA-256 of the file bytes and keep it on disk, shared by
+# every worker that mounts the same cache directory, with a small in-process LRU in front of it.
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Bump this whenever the extraction/normalisation output changes so stale entries are ignored
+EXTRACTION_VERSION = "1"
+
+_BLANK_LINES = re.compile(r"\n{2,}")
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the hex SHA-256 digest of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_page(content: str) -> str:
+    """Collapses every run of blank lines into a single newline in one linear pass."""
+    return _BLANK_LINES.sub("\n", content)
+
+
+def normalize_pages(pages) -> str:
+    """Joins page texts into the report string the Blood Test Report Reader has always returned."""
+    return "".join(normalize_page(page) + "\n" for page in pages)
+
+
+class ReportTextCache:
+    """
+    Two-level cache of cleaned report text keyed on file content hash.
+    Level 1 is an in-process LRU, level 2 is one file per digest under `directory`.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 64, enabled: bool = True, variant: str = ""):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.enabled = enabled
+        # Extraction settings that change the output (see pdf_ingest.ingest_signature) are part of the key
+        self.variant = variant
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, digest: str) -> str:
+        if self.variant:
+            return f"v{EXTRACTION_VERSION}-{self.variant}-{digest}"
+        return f"v{EXTRACTION_VERSION}-{digest}"
+
+    def _path(self, key: str) -> str:
+        # Shard by the first two hex chars of the digest to keep directories small
+        return os.path.join(self.directory, key[-64:-62], key + ".txt")
+
+    def _remember(self, key: str, text: str):
+        with self._lock:
+            self._memory[key] = text
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, digest: str):
+        """Returns the cached text for a digest, or None on a miss."""
+        if not self.enabled:
+            return None
+        key = self._key(digest)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        self._remember(key, text)
+        return text
+
+    def put(self, digest: str, text: str):
+        """Stores text for a digest in memory and on disk (atomic rename, safe across processes)."""
+        if not self.enabled:
+            return
+        key = self._key(digest)
+        self._remember(key, text)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get_or_extract(self, file_path: str, extract):
+        """Returns cached text for `file_path`, calling `extract(file_path)` only on a miss."""
+        if not self.enabled:
+            return extract(file_path)
+        digest = file_sha256(file_path)
+        text = self.get(digest)
+        if text is None:
+            text = extract(file_path)
+            self.put(digest, text)
+        return text
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
@@ -0,0 +1,253 @@
+## Priority queues and per-user fair scheduling
+# Interactive submissions are published straight to INTERACTIVE_QUEUE, which workers always check
+# before BATCH_QUEUE (see celery_app.py). Batch submissions are not published at once: their rows
+# wait in analysis_results (priority "batch", dispatched_at NULL) and `dispatch` hands at most
+# BATCH_MAX_IN_FLIGHT of them to Celery at a time, choosing users by weighted round-robin. A tenant
+# uploading thousands of reports so only ever holds its share of a short batch queue, and an
+# interactive job waits behind running jobs at most, never behind a backlog.
+# `dispatch` runs after every batch submission and whenever a job finishes. It can also be run by
+# hand (or from cron) to release jobs after a worker crash:
+#   python scheduler.py dispatch | status
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy import func, or_
+
+from database import SessionLocal, AnalysisResult, JobStatus
+from config import (
+    INTERACTIVE_QUEUE, BATCH_QUEUE, BATCH_MAX_IN_FLIGHT, USER_WEIGHTS, DEFAULT_USER_WEIGHT,
+    MAX_QUEUED_JOBS, MAX_QUEUED_JOBS_PER_USER, DEDUPE_STALE_AFTER_SECONDS,
+)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+QUEUES = {INTERACTIVE: INTERACTIVE_QUEUE, BATCH: BATCH_QUEUE}
+# Job IDs per claiming UPDATE, well below the bound-parameter limits of SQLite and Postgres
+_CLAIM_CHUNK = 500
+
+
+def parse_weights(spec: str) -> dict:
+    """Parses "tenant-a=3,tenant-b=1" into {"tenant-a": 3, "tenant-b": 1}."""
+    weights = {}
+    for item in spec.split(","):
+        if "=" in item:
+            user, weight = item.rsplit("=", 1)
+            weights[user.strip()] = max(1, int(weight))
+    return weights
+
+
+WEIGHTS = parse_weights(USER_WEIGHTS)
+
+
+def is_stale(record: AnalysisResult) -> bool:
+    """
+    True for a PENDING/RUNNING job that hasn't been dispatched or updated for DEDUPE_STALE_AFTER_SECONDS
+    (assumed dead). Batch jobs not yet handed to Celery are not stale: they may wait for hours to be
+    dispatched. Interactive jobs are published on submission (rows from before dispatched_at existed have none).
+    """
+    if record.status not in (JobStatus.PENDING, JobStatus.RUNNING) or _awaiting_dispatch(record):
+        return False
+    seen = [moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+            for moment in (record.dispatched_at, record.updated_at, record.created_at) if moment is not None]
+    return bool(seen) and (datetime.now(timezone.utc) - max(seen)).total_seconds() > DEDUPE_STALE_AFTER_SECONDS
+
+
+def _awaiting_dispatch(record: AnalysisResult) -> bool:
+    return record.priority == BATCH and record.dispatched_at is None
+
+
+def weighted_round_robin(waiting: dict, in_flight: dict, slots: int, weights: dict = None,
+                         default_weight: int = DEFAULT_USER_WEIGHT) -> list:
+    """
+    Picks up to `slots` jobs from per-user FIFO lanes (`waiting`: user -> job IDs, in the order users
+    should be served on a tie). Each pick goes to the user with the fewest in-flight jobs relative
+    to their weight, so over time users hold batch slots in proportion to their weights.
+    Returns [(user, job ID), ...] in dispatch order.
+    """
+    weights = WEIGHTS if weights is None else weights
+    lanes = {user: deque(ids) for user, ids in waiting.items() if ids}
+    load = {user: in_flight.get(user, 0) for user in lanes}
+    turn = {user: index for index, user in enumerate(lanes)}
+    picks = []
+    while lanes and len(picks) < slots:
+        user = min(lanes, key=lambda u: (load[u] / weights.get(u, default_weight), turn[u]))
+        picks.append((user, lanes[user].popleft()))
+        load[user] += 1
+        turn[user] = len(turn) + len(picks) # to the back of the line among equally loaded users
+        if not lanes[user]:
+            del lanes[user]
+    return picks
+
+
+## Queue depth and backpressure
+def queued_jobs(db, user_id: str = None) -> int:
+    """
+    Interactive jobs waiting in the broker (batch jobs there are capped by BATCH_MAX_IN_FLIGHT),
+    or, for a user, all their PENDING jobs including batch jobs waiting to be dispatched.
+    Jobs that look dead (see is_stale) don't count, so a crashed worker can't keep the queue full.
+    """
+    query = db.query(AnalysisResult).filter(AnalysisResult.status == JobStatus.PENDING)
+    if user_id is None:
+        query = query.filter(or_(AnalysisResult.priority.is_(None), AnalysisResult.priority == INTERACTIVE))
+    else:
+        query = query.filter(AnalysisResult.user_id == user_id)
+    # Batch jobs waiting to be dispatched are never stale, so only the others are loaded and checked
+    waiting = query.filter(AnalysisResult.priority == BATCH, AnalysisResult.dispatched_at.is_(None)).count()
+    published = query.filter(or_(
+        AnalysisResult.priority.is_(None), AnalysisResult.priority != BATCH, AnalysisResult.dispatched_at.isnot(None)
+    )).all()
+    return waiting + sum(1 for record in published if not is_stale(record))
+
+
+def check_backpressure(db, user_id: str, new_jobs: int = 1, priority: str = INTERACTIVE):
+    """Returns why `new_jobs` more jobs must be refused right now, or None if they can be queued."""
+    if priority == INTERACTIVE and MAX_QUEUED_JOBS:
+        depth = queued_jobs(db)
+        if depth + new_jobs > MAX_QUEUED_JOBS:
+            return f"The queue is full ({depth} jobs waiting, limit {MAX_QUEUED_JOBS}). Please try again later."
+    if MAX_QUEUED_JOBS_PER_USER:
+        depth = queued_jobs(db, user_id)
+        if depth + new_jobs > MAX_QUEUED_JOBS_PER_USER:
+            return (
+                f"User {user_id} has {depth} jobs waiting and {new_jobs} more would exceed the limit of "
+                f"{MAX_QUEUED_JOBS_PER_USER}. Please try again later."
+            )
+    return None
+
+
+## Dispatching
+def _signature(record: AnalysisResult):
+    from worker import run_crew_analysis
+
+    return run_crew_analysis.s(query=record.query, file_path=record.file_path, result_id=record.id).set(
+        task_id=record.task_id, queue=QUEUES.get(record.priority, INTERACTIVE_QUEUE)
+    )
+
+
+def publish(record: AnalysisResult):
+    _signature(record).apply_async()
+
+
+def publish_many(records):
+    """Publishes the jobs as a single Celery group, over one producer connection."""
+    from celery import group
+
+    group(_signature(record) for record in records).apply_async()
+
+
+def _batch_in_flight(db) -> dict:
+    """user -> batch jobs handed to Celery and not finished (jobs that look dead don't count)."""
+    records = db.query(AnalysisResult).filter(
+        AnalysisResult.priority == BATCH,
+        AnalysisResult.dispatched_at.isnot(None),
+        AnalysisResult.status.in_([JobStatus.PENDING, JobStatus.RUNNING]),
+    ).all()
+    counts = {}
+    for record in records:
+        if not is_stale(record):
+            counts[record.user_id] = counts.get(record.user_id, 0) + 1
+    return counts
+
+
+def _waiting(db, limit: int) -> dict:
+    """user -> oldest `limit` undispatched batch job IDs, least recently served users first."""
+    last_served = dict(
+        db.query(AnalysisResult.user_id, func.max(AnalysisResult.dispatched_at)).filter(
+            AnalysisResult.priority == BATCH, AnalysisResult.dispatched_at.isnot(None)
+        ).group_by(AnalysisResult.user_id).all()
+    )
+    users = [user for (user,) in db.query(AnalysisResult.user_id).filter(
+        AnalysisResult.priority == BATCH,
+        AnalysisResult.status == JobStatus.PENDING,
+        AnalysisResult.dispatched_at.is_(None),
+    ).distinct()]
+    users.sort(key=lambda user: (last_served.get(user) is not None, str(last_served.get(user) or "")))
+    return {
+        user: [result_id for (result_id,) in db.query(AnalysisResult.id).filter(
+            AnalysisResult.priority == BATCH,
+            AnalysisResult.status == JobStatus.PENDING,
+            AnalysisResult.dispatched_at.is_(None),
+            AnalysisResult.user_id == user,
+        ).order_by(AnalysisResult.id).limit(limit)]
+        for user in users
+    }
+
+
+def dispatch(db=None) -> int:
+    """Hands waiting batch jobs to Celery until BATCH_MAX_IN_FLIGHT are in flight. Returns how many were published."""
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        in_flight = _batch_in_flight(db)
+        slots = BATCH_MAX_IN_FLIGHT - sum(in_flight.values()) if BATCH_MAX_IN_FLIGHT else 10 ** 6
+        if slots <= 0:
+            return 0
+        picked = [result_id for _, result_id in weighted_round_robin(_waiting(db, slots), in_flight, slots)]
+        if not picked:
+            return 0
+        # Claiming the rows first means two dispatchers never publish the same job. The claim time
+        # tells this dispatcher's rows from those another one claimed in the meantime.
+        claimed_at = datetime.now(timezone.utc)
+        chunks = [picked[i:i + _CLAIM_CHUNK] for i in range(0, len(picked), _CLAIM_CHUNK)]
+        for chunk in chunks:
+            db.query(AnalysisResult).filter(
+                AnalysisResult.id.in_(chunk), AnalysisResult.dispatched_at.is_(None)
+            ).update({"dispatched_at": claimed_at}, synchronize_session=False)
+        db.commit()
+        records = {}
+        for chunk in chunks:
+            records.update((record.id, record) for record in db.query(AnalysisResult).filter(
+                AnalysisResult.id.in_(chunk), AnalysisResult.dispatched_at == claimed_at
+            ))
+        # In the scheduler's order, so each user's share is published interleaved
+        claimed = [records[result_id] for result_id in picked if result_id in records]
+        if not claimed:
+            return 0
+        try:
+            publish_many(claimed)
+        except Exception as e:
+            # Put them back in line; the next dispatch retries them
+            for chunk in chunks:
+                db.query(AnalysisResult).filter(
+                    AnalysisResult.id.in_(chunk), AnalysisResult.dispatched_at == claimed_at
+                ).update({"dispatched_at": None}, synchronize_session=False)
+            db.commit()
+            print(f"Warning: could not publish {len(claimed)} batch jobs: {e}")
+            return 0
+        return len(claimed)
+    finally:
+        if own_session:
+            db.close()
+
+
+def status(db=None) -> dict:
+    own_session = db is None
+    db = db or SessionLocal()
+    try:
+        waiting = db.query(AnalysisResult.user_id, func.count(AnalysisResult.id)).filter(
+            AnalysisResult.priority == BATCH,
+            AnalysisResult.status == JobStatus.PENDING,
+            AnalysisResult.dispatched_at.is_(None),
+        ).group_by(AnalysisResult.user_id).all()
+        return {
+            "queued": queued_jobs(db),
+            "batch_in_flight": _batch_in_flight(db),
+            "batch_waiting": dict(waiting),
+        }
+    finally:
+        if own_session:
+            db.close()
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command == "dispatch":
+        print(f"Published {dispatch()} batch jobs.")
+    elif command == "status":
+        print(json.dumps(status(), indent=2, default=str))
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
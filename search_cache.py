@@ -0,0 +1,133 @@
+## Shared TTL cache for web searches
+# The doctor, nutritionist and fitness agents keep searching for the same few things
+# ("LDL cholesterol normal range", "LDL Cholesterol - normal range?", ...) across reports.
+# Queries are normalized into a canonical key and results are kept in the same SQLite-backed,
+# TTL- and size-bounded store as LLM responses (llm_cache.ResponseCache, separate table),
+# so every worker sharing the cache file reuses them. The cache can be warmed offline:
+#   python search_cache.py warm "LDL cholesterol normal range" ...
+#   python search_cache.py warm-reports data/*.pdf [--stub]
+#   python search_cache.py stats | clear
+import hashlib
+import json
+import re
+import time
+import unicodedata
+
+from llm_cache import ResponseCache
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+# Filler words that don't change what a lab-value search returns
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "for", "in", "is", "my", "of", "on", "the", "to", "what", "whats", "with",
+})
+
+
+def normalize_search_query(query: str) -> str:
+    """
+    Canonical form of a query: case-, punctuation- and filler-insensitive. Word order is kept,
+    since it carries meaning ("low HDL high LDL" is not "high HDL low LDL").
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    return " ".join(token for token in _TOKEN.findall(text) if token not in _STOPWORDS)
+
+
+def search_key(query: str, **params) -> str:
+    """Cache key for a query plus the tool settings that change its results (type, country, ...)."""
+    payload = json.dumps({"q": normalize_search_query(query), **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """Search results keyed on the normalized query, stored as JSON in a ResponseCache table."""
+
+    def __init__(self, path: str, max_entries: int = 20000, ttl_seconds: float = 30 * 24 * 3600):
+        self.store = ResponseCache(path, max_entries=max_entries, ttl_seconds=ttl_seconds, table="search_results")
+
+    def get(self, query: str, **params):
+        cached = self.store.get(search_key(query, **params))
+        return None if cached is None else json.loads(cached)
+
+    def put(self, query: str, result, latency: float = 0.0, **params):
+        self.store.put(search_key(query, **params), json.dumps(result, default=str), latency=latency)
+
+    def fetch(self, query: str, search, **params):
+        """Returns the cached result, or calls `search()` and caches what it returns."""
+        cached = self.get(query, **params)
+        if cached is not None:
+            return cached
+        started = time.perf_counter()
+        result = search()
+        if result:
+            self.put(query, result, latency=time.perf_counter() - started, **params)
+        return result
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+    def clear(self):
+        self.store.clear()
+
+
+def report_queries(paths, template: str = "{name} normal range") -> list:
+    """Queries the agents typically make for the biomarkers found in these reports, flagged ones first."""
+    from biomarkers import extract_biomarkers
+    from tools import extract_report_text
+
+    queries = []
+    for path in paths:
+        table = extract_biomarkers(extract_report_text(path))
+        flagged = table.out_of_range()
+        for name in flagged.names + table.names:
+            query = template.format(name=name)
+            if query not in queries:
+                queries.append(query)
+    return queries
+
+
+def warm(queries) -> dict:
+    """Runs every query through the cached search tool; returns how many were fetched vs already cached."""
+    from tools import search_tool
+
+    if search_tool.search_cache is None:
+        raise RuntimeError("The search cache is disabled (SEARCH_CACHE_ENABLED=false)")
+    counts = {"fetched": 0, "cached": 0, "failed": 0}
+    for query in queries:
+        if search_tool.search_cache.get(query, **search_tool.cache_params()) is not None:
+            counts["cached"] += 1
+            continue
+        try:
+            search_tool._run(search_query=query)
+            counts["fetched"] += 1
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"Warning: search for {query!r} failed: {e}")
+    return counts
+
+
+if __name__ == "__main__":
+    import sys
+
+    args = sys.argv[1:]
+    if "--stub" in args:
+        # Offline run against the local Serper stand-in (benchmarks/stubs.py)
+        args.remove("--stub")
+        sys.path.insert(0, "benchmarks")
+        from stubs import stub_search
+
+        stub_search(latency=0.0)
+
+    command = args[0] if args else "stats"
+    if command == "warm":
+        print(warm(args[1:]))
+    elif command == "warm-reports":
+        print(warm(report_queries(args[1:] or ["data/sample.pdf"])))
+    elif command in ("stats", "clear"):
+        from config import SEARCH_CACHE_PATH
+
+        cache = SearchCache(SEARCH_CACHE_PATH)
+        if command == "clear":
+            cache.clear()
+        print(json.dumps(cache.stats(), indent=2))
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
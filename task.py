@@ -2,10 +2,11 @@
 from crewai import Task
 # MODIFIED: Import all agents and tools
 from agents import doctor, verifier, nutritionist, exercise_specialist, report_compiler
-from tools import blood_test_tool, nutrition_tool, exercise_tool
+from tools import blood_test_tool, biomarker_tool, nutrition_tool, exercise_tool
 
 # Task 1: Verification
 verification = Task(
+    name="verification",
     description="Verify that the file at {file_path} appears to be a medical document, like a blood report. "
                 "Scan the document for common medical terms, tables, and reference ranges. "
                 "State whether the document is suitable for medical analysis.",
@@ -19,10 +20,12 @@ verification = Task(
 
 # Task 2: Main Analysis
 help_patients = Task(
+    name="help_patients",
     description="Analyze the blood test report from this file: {file_path}.\n"
-                "First, read the content of the file using the Blood Test Report Reader tool.\n"
+                "First, extract the biomarkers from the file using the Blood Test Biomarker Extractor tool. "
+                "It returns one row per biomarker with its value, unit, reference range and a HIGH/LOW flag.\n"
                 "Then, provide a summary of the key findings based on the user's query: {query}.\n"
-                "Identify any biomarkers that are outside of the standard reference ranges and explain what they typically measure.\n"
+                "Explain the biomarkers flagged HIGH or LOW and what they typically measure.\n"
                 "Conclude with a clear disclaimer that this is an AI-generated analysis and not a substitute for professional medical advice.",
     expected_output="""A clear, structured summary of the blood test report. The output should be in Markdown format and include:
 - A brief introduction addressing the user's query.
@@ -30,7 +33,7 @@ help_patients = Task(
 - A section titled 'Analysis' highlighting any values that are high or low, with a brief, neutral explanation of what these markers generally relate to.
 - A concluding paragraph with a strong disclaimer urging the user to consult a qualified healthcare professional for a proper diagnosis and treatment plan.""",
     agent=doctor,
-    tools=[blood_test_tool],
+    tools=[biomarker_tool],
     async_execution=False,
     # MODIFIED: Make this task dependent on the verification task
     context=[verification]
@@ -38,6 +41,7 @@ help_patients = Task(
 
 # Task 3: Nutrition Advice
 nutrition_analysis = Task(
+    name="nutrition_analysis",
     description="Based on the medical report analysis provided in the context, provide general nutrition advice. "
                 "Focus on well-established links between biomarkers and diet. Do not recommend specific supplements "
                 "unless they are widely recognized (e.g., iron for anemia).",
@@ -54,6 +58,7 @@ nutrition_analysis = Task(
 
 # Task 4: Exercise Plan
 exercise_planning = Task(
+    name="exercise_planning",
     description="Based on the medical report analysis provided in the context, create a general exercise plan. "
                 "The plan should be safe and suitable for a general audience. "
                 "Do not suggest overly strenuous or high-risk activities.",
@@ -71,6 +76,7 @@ exercise_planning = Task(
 
 # ADDED: Task 5: Final Report Compilation
 compile_report_task = Task(
+    name="compile_report_task",
     description="Compile the analysis from the doctor, the nutritional advice, and the exercise plan into a single, cohesive report. "
                 "The final output should be a well-structured Markdown document that is easy for the user to read. "
                 "Ensure all necessary disclaimers from the previous tasks are included and prominently displayed.",
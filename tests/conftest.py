@@ -0,0 +1,28 @@
+## Test setup: every backend points at throwaway local state
+# config.py reads the environment when it is imported, so this runs before any repo module is.
+# Nothing here needs Redis, Gemini or Serper: Celery uses the in-memory broker, and the LLM and
+# searches are the local stand-ins in benchmarks/stubs.py, installed before any agent is built.
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="crew-tests-")
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(WORKDIR, 'tests.db')}",
+    CELERY_BROKER_URL="memory://",
+    CELERY_RESULT_BACKEND="cache+memory://",
+    REPORT_CACHE_DIR=os.path.join(WORKDIR, "report_cache"),
+    LLM_CACHE_ENABLED="false",
+    SEARCH_CACHE_PATH=os.path.join(WORKDIR, "search_cache.sqlite3"),
+    LLM_RPM="0", LLM_TPM="0", SEARCH_RPM="0",
+    CREWAI_DISABLE_TELEMETRY="true",
+    OTEL_SDK_DISABLED="true",
+)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import stubs  # noqa: E402
+
+stubs.install(llm_latency=0.0, search_latency=0.0)
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from biomarkers import BiomarkerTable, extract_biomarkers
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.fixture(scope="module", params=["sample.pdf", "blood_test_report.pdf"])
+def table(request):
+    from tools import extract_report_text
+
+    return extract_biomarkers(extract_report_text(os.path.join(DATA, request.param)))
+
+
+def _row(table, name):
+    return next(record for record in table.to_records() if record["name"] == name)
+
+
+def test_sample_reports_parse_every_row(table):
+    assert len(table) == 55
+    assert len(table.out_of_range()) == 6
+
+
+def test_out_of_range_values_are_flagged(table):
+    assert _row(table, "AST (SGOT)") == {"name": "AST (SGOT)", "value": 11.0, "unit": "U/L", "low": 15.0, "high": 40.0, "flag": "LOW"}
+    alp = _row(table, "Alkaline Phosphatase (ALP)")
+    assert (alp["value"], alp["low"], alp["high"], alp["flag"]) == (150.0, 30.0, 120.0, "HIGH")
+
+
+def test_open_ended_ranges_parse_with_one_bound(table):
+    assert (_row(table, "Cholesterol, Total")["low"], _row(table, "Cholesterol, Total")["high"]) == (None, 200.0)
+    assert (_row(table, "GFR Estimated")["low"], _row(table, "GFR Estimated")["high"]) == (59.0, None)
+
+
+def test_flags_treat_missing_bounds_as_open_ended():
+    table = BiomarkerTable(
+        names=["LDL", "HDL", "eGFR", "Ratio"],
+        values=[250.0, 30.0, 40.0, 10.0],
+        units=["mg/dL", "mg/dL", "mL/min", ""],
+        lows=[np.nan, 40.0, 59.0, np.nan],   # "<100", ">40", ">59", no range
+        highs=[100.0, np.nan, np.nan, np.nan],
+    )
+    assert list(table.flags()) == ["HIGH", "LOW", "LOW", ""]
+    assert BiomarkerTable(["LDL"], [50.0], ["mg/dL"], [np.nan], [100.0]).flags()[0] == ""
+    assert "<100" in table.to_prompt() and ">40" in table.to_prompt()
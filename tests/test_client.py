@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import client
+import scheduler
+from database import SessionLocal, AnalysisResult, JobStatus, init_db
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sample.pdf")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """An empty results table; published jobs are recorded instead of sent to a worker."""
+    init_db()
+    session = SessionLocal()
+    session.query(AnalysisResult).delete()
+    session.commit()
+    published = []
+    monkeypatch.setattr(client, "publish", lambda record: published.append(record.id))
+    yield session, published
+    session.query(AnalysisResult).delete()
+    session.commit()
+    session.close()
+
+
+def _fail(session, task_id: str):
+    session.query(AnalysisResult).filter(AnalysisResult.task_id == task_id).update(
+        {"status": JobStatus.FAILURE, "dedupe_key": None}
+    )
+    session.commit()
+
+
+def test_resumed_job_reclaims_its_dedupe_key(db):
+    session, published = db
+    task_id = client.submit_analysis_job("q", SAMPLE)
+    _fail(session, task_id)
+    result_id = session.query(AnalysisResult.id).filter(AnalysisResult.task_id == task_id).scalar()
+
+    resumed = client.resume_analysis_job(result_id)
+    assert resumed not in (None, task_id)
+    assert published == [result_id, result_id]
+    # An identical submission during the resumed run attaches to it
+    assert client.submit_analysis_job("q", SAMPLE) == resumed
+    assert session.query(AnalysisResult).count() == 1
+
+
+def test_resume_attaches_to_a_job_that_took_the_key(db):
+    session, published = db
+    failed = client.submit_analysis_job("q", SAMPLE)
+    _fail(session, failed)
+    replacement = client.submit_analysis_job("q", SAMPLE)
+    result_id = session.query(AnalysisResult.id).filter(AnalysisResult.task_id == failed).scalar()
+
+    assert client.resume_analysis_job(result_id) == replacement
+    session.expire_all()
+    assert session.get(AnalysisResult, result_id).status == JobStatus.FAILURE
+    assert len(published) == 2
+
+
+def test_resume_respects_backpressure(db, monkeypatch):
+    session, published = db
+    failed = client.submit_analysis_job("q", SAMPLE)
+    _fail(session, failed)
+    client.submit_analysis_job("another question", SAMPLE)
+    monkeypatch.setattr(scheduler, "MAX_QUEUED_JOBS", 1)
+    result_id = session.query(AnalysisResult.id).filter(AnalysisResult.task_id == failed).scalar()
+
+    assert client.resume_analysis_job(result_id) is None
+    session.expire_all()
+    assert session.get(AnalysisResult, result_id).status == JobStatus.FAILURE
@@ -0,0 +1,41 @@
+import pytest
+from crewai import Agent, Task
+
+from crew_builder import build_crew
+from stubs import StubLLM
+
+
+class FailingLLM(StubLLM):
+    def call(self, messages, *args, **kwargs):
+        raise TimeoutError("LLM request timed out")
+
+
+def _agent(role: str, llm) -> Agent:
+    return Agent(role=role, goal=f"Act as the {role}", backstory="A test agent.", llm=llm, max_retry_limit=0)
+
+
+def _crew(sibling_latency: float):
+    first = _agent("first", StubLLM(latency=0.0, tool_calls=0))
+    failing = _agent("failing", FailingLLM(latency=0.0))
+    slow = _agent("slow", StubLLM(latency=sibling_latency, tool_calls=0))
+    base = Task(name="base", description="Start.", expected_output="Text.", agent=first)
+    tasks = [
+        base,
+        Task(name="failing", description="Fail.", expected_output="Text.", agent=failing, context=[base]),
+        Task(name="slow", description="Take a while.", expected_output="Text.", agent=slow, context=[base]),
+    ]
+    return build_crew([first, failing, slow], tasks)
+
+
+def test_parallel_level_runs_concurrently():
+    crew = _crew(sibling_latency=0.0)
+    assert [task.name for task in crew.tasks] == ["base", "failing", "slow", "join"]
+    assert crew.tasks[1].async_execution and crew.tasks[2].async_execution
+
+
+def test_failed_task_fails_the_crew_after_its_siblings_finish():
+    crew = _crew(sibling_latency=1.0)
+    with pytest.raises(TimeoutError):
+        crew.kickoff()
+    # The sibling finished before kickoff returned, so it can't report into a later job
+    assert crew.tasks[2].output is not None
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from document_check import ACCEPT, AMBIGUOUS, REJECT, score_document
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sample.pdf")
+
+INVOICE = """ACME Office Supplies Ltd.
+INVOICE #2024-0117        Date: 12/03/2024
+Bill to: Jane Doe, 42 Harbour Street, Springfield
+Item                         Qty    Unit price    Total
+A4 printer paper (box)         4        24.99      99.96
+Ballpoint pens (pack of 50)    2        11.50      23.00
+Desk organiser                 1        18.75      18.75
+Subtotal 141.71   VAT 28.34   Total due 170.05
+Payment terms: 30 days. Thank you for your business!
+"""
+
+
+def _decide(text: str) -> str:
+    return score_document(text).decision(0.6, 0.2, 200)
+
+
+def test_lab_report_is_accepted():
+    from tools import extract_report_text
+
+    assert _decide(extract_report_text(SAMPLE)) == ACCEPT
+
+
+def test_unrelated_document_is_rejected():
+    assert _decide(INVOICE) == REJECT
+
+
+@pytest.mark.parametrize("text", ["", "   \n\n", "Scanned page 1 of 3"])
+def test_too_little_text_is_left_to_the_verifier(text):
+    assert _decide(text) == AMBIGUOUS
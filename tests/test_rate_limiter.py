@@ -0,0 +1,33 @@
+from rate_limiter import RateLimitExceeded, is_transient_error
+
+
+class RateLimitError(Exception):
+    """Named like litellm's."""
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_rate_limits_timeouts_and_server_errors_are_transient():
+    for error in (RateLimitExceeded(), RateLimitError(), TimeoutError(), ConnectionError(), HTTPError(429), HTTPError(503)):
+        assert is_transient_error(error), error
+
+
+def test_wrapped_transient_errors_are_found():
+    try:
+        try:
+            raise TimeoutError("LLM request timed out")
+        except TimeoutError as timeout:
+            raise ValueError("task failed") from timeout
+    except ValueError as error:
+        assert is_transient_error(error)
+
+
+def test_messages_mentioning_429_are_not_rate_limits():
+    assert not is_transient_error(ValueError("The document at uploads/invoice_4291.pdf is not a medical report"))
+    assert not is_transient_error(ValueError("rate limit of the lab: 429 cells/mL"))
+    assert not is_transient_error(HTTPError(404))
+    assert not is_transient_error(FileNotFoundError("report.pdf"))
@@ -0,0 +1,60 @@
+from report_assembler import DEFAULT_DISCLAIMER, assemble_report, dedupe_disclaimers, split_disclaimers
+
+OUTPUTS = {
+    "exercise_planning": "## Plan\nWalk 30 minutes a day.\n\nDisclaimer: consult your doctor before starting a new exercise program.",
+    "help_patients": (
+        "# Blood Test Analysis\nYour AST is slightly low. This is not a substitute for professional medical advice."
+    ),
+    "nutrition_analysis": (
+        "Eat more leafy greens. Supplements are not a substitute for a balanced diet, so focus on whole foods.\n\n"
+        "**Disclaimer:** This is not a substitute for professional medical advice."
+    ),
+}
+
+
+def _section(report: str, heading: str) -> str:
+    return report.split(heading, 1)[1].split("\n## ", 1)[0]
+
+
+def test_sections_follow_the_fixed_order():
+    report = assemble_report(OUTPUTS, "What does my report say?")
+    headings = [line for line in report.splitlines() if line.startswith("## ")]
+    assert headings == [
+        "## 1. Blood Test Analysis",
+        "## 2. Nutritional Recommendations",
+        "## 3. Exercise Recommendations",
+        "## 4. Final Disclaimers",
+    ]
+    assert report.startswith("# Blood Test Report Analysis\n\n**Your question:** What does my report say?")
+    assert "### Plan" in _section(report, "## 3. Exercise Recommendations")
+
+
+def test_missing_sections_are_marked():
+    report = assemble_report({"help_patients": "All values are within range."})
+    assert "_No output was produced for this section._" in _section(report, "## 2. Nutritional Recommendations")
+
+
+def test_disclaimers_are_moved_and_deduplicated():
+    report = assemble_report(OUTPUTS)
+    closing = _section(report, "## 4. Final Disclaimers")
+    assert "not a substitute for professional medical advice" not in _section(report, "## 1. Blood Test Analysis")
+    assert "consult your doctor before starting a new exercise program" in closing
+    # Both agents' "not a substitute for professional medical advice" are covered by the default one
+    assert closing.count("not a substitute for") == 1
+    assert DEFAULT_DISCLAIMER in closing
+
+
+def test_dedupe_keeps_the_fuller_wording_in_the_first_position():
+    short = "Consult a doctor."
+    full = "Consult a doctor before changing your diet."
+    other = "Results may vary between laboratories."
+    assert dedupe_disclaimers([short, other, full]) == [full, other]
+
+
+def test_advice_mentioning_a_substitute_stays_in_its_section():
+    body, disclaimers = split_disclaimers(OUTPUTS["nutrition_analysis"])
+    assert "Supplements are not a substitute for a balanced diet, so focus on whole foods." in "\n".join(body)
+    assert disclaimers == ["This is not a substitute for professional medical advice."]
+    report = assemble_report(OUTPUTS)
+    assert "Supplements are not a substitute for a balanced diet" in _section(report, "## 2. Nutritional Recommendations")
+    assert "Supplements" not in _section(report, "## 4. Final Disclaimers")
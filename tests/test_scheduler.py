@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import scheduler
+from celery_app import celery_app
+from database import SessionLocal, AnalysisResult, JobStatus, init_db
+from scheduler import BATCH, weighted_round_robin, is_stale, dispatch
+
+
+## weighted_round_robin
+def test_equal_weights_alternate_between_users():
+    picks = weighted_round_robin({"a": [1, 2, 3], "b": [4, 5, 6]}, {}, slots=4, weights={})
+    assert picks == [("a", 1), ("b", 4), ("a", 2), ("b", 5)]
+
+
+def test_weights_set_each_users_share():
+    picks = weighted_round_robin({"a": list(range(10)), "b": list(range(10, 20))}, {}, slots=6, weights={"a": 2})
+    users = [user for user, _ in picks]
+    assert users.count("a") == 4 and users.count("b") == 2
+    # Interleaved, not one user's share after the other's
+    assert users[:2] == ["a", "b"]
+
+
+def test_in_flight_jobs_count_against_a_users_share():
+    picks = weighted_round_robin({"a": [1, 2], "b": [3, 4]}, {"a": 2}, slots=3, weights={})
+    assert picks == [("b", 3), ("b", 4), ("a", 1)]
+
+
+def test_a_user_whose_lane_runs_out_leaves_the_slots_to_the_others():
+    picks = weighted_round_robin({"a": [1], "b": [2, 3, 4]}, {}, slots=10, weights={})
+    assert picks == [("a", 1), ("b", 2), ("b", 3), ("b", 4)]
+
+
+## is_stale
+def test_waiting_batch_jobs_are_never_stale():
+    long_ago = datetime.now(timezone.utc) - timedelta(days=2)
+    waiting = AnalysisResult(status=JobStatus.PENDING, priority=BATCH, created_at=long_ago)
+    dispatched = AnalysisResult(status=JobStatus.PENDING, priority=BATCH, created_at=long_ago, dispatched_at=long_ago)
+    assert not is_stale(waiting)
+    assert is_stale(dispatched)
+
+
+def test_interactive_jobs_without_a_dispatch_time_can_be_stale():
+    # Rows written before dispatched_at existed
+    long_ago = datetime.now(timezone.utc) - timedelta(days=2)
+    assert is_stale(AnalysisResult(status=JobStatus.PENDING, created_at=long_ago, updated_at=long_ago))
+    assert not is_stale(AnalysisResult(status=JobStatus.PENDING, created_at=datetime.now(timezone.utc)))
+
+
+## dispatch against the in-memory broker
+@pytest.fixture
+def db():
+    init_db()
+    session = SessionLocal()
+    session.query(AnalysisResult).delete()
+    session.commit()
+    _purge_batch_queue()
+    yield session
+    session.query(AnalysisResult).delete()
+    session.commit()
+    session.close()
+    _purge_batch_queue()
+
+
+def _purge_batch_queue():
+    with celery_app.connection_for_write() as connection:
+        channel = connection.default_channel
+        channel.queue_declare(scheduler.BATCH_QUEUE)
+        channel.queue_purge(scheduler.BATCH_QUEUE)
+
+
+def _batch_queue_depth() -> int:
+    with celery_app.connection_for_read() as connection:
+        return connection.default_channel.queue_declare(scheduler.BATCH_QUEUE, passive=True).message_count
+
+
+def _add_batch_jobs(db, user_id: str, count: int):
+    db.add_all(
+        AnalysisResult(task_id=f"{user_id}-{i}", user_id=user_id, file_path="data/sample.pdf", query="q", priority=BATCH)
+        for i in range(count)
+    )
+    db.commit()
+
+
+def test_dispatch_publishes_up_to_the_in_flight_cap(db, monkeypatch):
+    monkeypatch.setattr(scheduler, "BATCH_MAX_IN_FLIGHT", 3)
+    _add_batch_jobs(db, "alice", 4)
+    _add_batch_jobs(db, "bob", 2)
+
+    assert dispatch() == 3
+    assert _batch_queue_depth() == 3
+    dispatched = db.query(AnalysisResult).filter(AnalysisResult.dispatched_at.isnot(None)).all()
+    assert sorted(record.user_id for record in dispatched) == ["alice", "alice", "bob"]
+
+    # All slots are taken until a dispatched job finishes
+    assert dispatch() == 0
+    dispatched[0].status = JobStatus.SUCCESS
+    db.commit()
+    assert dispatch() == 1
+    assert _batch_queue_depth() == 4
+
+
+def test_dispatch_without_a_cap_publishes_every_waiting_job(db, monkeypatch):
+    monkeypatch.setattr(scheduler, "BATCH_MAX_IN_FLIGHT", 0)
+    _add_batch_jobs(db, "alice", 5)
+
+    assert dispatch() == 5
+    assert _batch_queue_depth() == 5
+    assert dispatch() == 0
+
+
+## queue depth
+def test_queue_depth_ignores_jobs_that_look_dead(db):
+    long_ago = datetime.now(timezone.utc) - timedelta(days=2)
+    now = datetime.now(timezone.utc)
+    db.add_all([
+        AnalysisResult(task_id="stuck", user_id="alice", file_path="data/sample.pdf", query="q",
+                       created_at=long_ago, dispatched_at=long_ago),
+        AnalysisResult(task_id="live", user_id="alice", file_path="data/sample.pdf", query="q", dispatched_at=now),
+    ])
+    db.commit()
+    _add_batch_jobs(db, "alice", 2)
+
+    assert scheduler.queued_jobs(db) == 1
+    assert scheduler.queued_jobs(db, "alice") == 3
@@ -0,0 +1,47 @@
+import pytest
+from crewai_tools import SerperDevTool
+
+from search_cache import SearchCache, normalize_search_query, search_key
+
+
+def test_normalization_ignores_case_punctuation_and_filler_words():
+    assert normalize_search_query("What is the normal range for LDL cholesterol?") == "normal range ldl cholesterol"
+    assert search_key("LDL Cholesterol - normal range?") == search_key("ldl cholesterol normal range")
+
+
+def test_normalization_keeps_word_order():
+    assert search_key("low HDL high LDL") != search_key("high HDL low LDL")
+
+
+@pytest.fixture
+def cached_search(tmp_path, monkeypatch):
+    """The agents' search tool on a fresh cache, with Serper replaced by the local stub."""
+    import stubs
+    from tools import CachedSerperDevTool
+
+    # stub_search patches SerperDevTool for good; monkeypatch puts the original back afterwards
+    monkeypatch.setattr(SerperDevTool, "_run", SerperDevTool._run)
+    stubs.stub_search(latency=0.0)
+    calls = []
+    stub = SerperDevTool._run
+    monkeypatch.setattr(SerperDevTool, "_run", lambda self, **kwargs: calls.append(kwargs) or stub(self, **kwargs))
+    tool = CachedSerperDevTool(search_cache=SearchCache(str(tmp_path / "search.sqlite3")))
+    return tool, calls
+
+
+def test_repeated_search_is_served_from_cache(cached_search):
+    tool, calls = cached_search
+    first = tool._run(search_query="LDL cholesterol normal range")
+    again = tool._run(search_query="ldl cholesterol, normal range?")
+    assert again == first
+    assert len(calls) == 1
+    assert tool.search_cache.stats()["hits"] == 1
+
+
+def test_opposite_queries_are_not_answered_from_each_other(cached_search):
+    tool, calls = cached_search
+    low_hdl = tool._run(search_query="low HDL high LDL")
+    high_hdl = tool._run(search_query="high HDL low LDL")
+    assert len(calls) == 2
+    assert low_hdl["searchParameters"]["q"] == "low HDL high LDL"
+    assert high_hdl["searchParameters"]["q"] == "high HDL low LDL"
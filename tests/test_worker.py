@@ -0,0 +1,165 @@
+import os
+
+import pytest
+from pypdf import PdfReader, PdfWriter
+
+import tools
+from database import SessionLocal, AnalysisResult, AnalysisStep, JobStatus, init_db
+from stubs import StubLLM
+from worker import AnalysisJob, DocumentRejected
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SAMPLE = os.path.join(DATA, "sample.pdf")
+# Words from each stage's task description (task.py) or tool prompts (tools.py), to tell which
+# stage an LLM call belongs to
+STAGES = {
+    "verification": ("appears to be a medical document",),
+    "help_patients": ("Analyze the blood test report",),
+    "nutrition_analysis": ("provide general nutrition advice", "clinical nutritionist"),
+    "exercise_planning": ("create a general exercise plan", "certified fitness planner"),
+}
+
+
+@pytest.fixture
+def db():
+    init_db()
+    session = SessionLocal()
+    yield session
+    session.query(AnalysisStep).delete()
+    session.query(AnalysisResult).delete()
+    session.commit()
+    session.close()
+
+
+def _new_job(session, file_path: str, query: str = "Summarise my report") -> AnalysisJob:
+    record = AnalysisResult(task_id=f"test-{os.urandom(6).hex()}", file_path=file_path, query=query)
+    session.add(record)
+    session.commit()
+    return AnalysisJob(query, file_path, record.id)
+
+
+def _checkpoint(session, job: AnalysisJob, **outputs):
+    """Records finished stages as an earlier attempt of `job` would have."""
+    session.add_all(
+        AnalysisStep(result_id=job.result_id, step_name=name, agent="test", output=output) for name, output in outputs.items()
+    )
+    session.commit()
+
+
+def _status(session, job: AnalysisJob) -> JobStatus:
+    session.expire_all()
+    return session.get(AnalysisResult, job.result_id).status
+
+
+class LLMCalls:
+    """(stage, prompt) of every stub LLM call. Stages in `fail` get one TimeoutError, as from a provider timeout."""
+
+    def __init__(self):
+        self.prompts = []
+        self.fail = set()
+
+    def stages(self) -> set:
+        return {stage for stage, _ in self.prompts}
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    calls = LLMCalls()
+    call = StubLLM.call
+
+    def recording_call(self, messages, *args, **kwargs):
+        prompt = str(messages)
+        stage = next((name for name, phrases in STAGES.items() if any(words in prompt for words in phrases)), None)
+        calls.prompts.append((stage, prompt))
+        if stage in calls.fail:
+            calls.fail.discard(stage)
+            raise TimeoutError("LLM request timed out")
+        return call(self, messages, *args, **kwargs)
+
+    monkeypatch.setattr(StubLLM, "call", recording_call)
+    return calls
+
+
+def _write_pages(path, pages):
+    reader = PdfReader(os.path.join(DATA, "sample.pdf"))
+    writer = PdfWriter()
+    for index in pages:
+        writer.add_page(reader.pages[index])
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_reused_crew_does_not_serve_tool_results_of_an_earlier_upload(db, tmp_path, monkeypatch):
+    extracted = []
+    run = tools.BiomarkerExtractionTool._run
+    monkeypatch.setattr(tools.BiomarkerExtractionTool, "_run", lambda self, **kwargs: extracted.append(run(self, **kwargs)) or extracted[-1])
+    upload = str(tmp_path / "upload.pdf")
+
+    _write_pages(upload, range(10))
+    _new_job(db, upload).run()
+    # Another patient's report uploaded under the same path
+    _write_pages(upload, range(3))
+    _new_job(db, upload).run()
+
+    assert len(extracted) == 2
+    assert extracted[0] != extracted[1]
+
+
+def test_checkpointed_stages_are_skipped(db):
+    job = _new_job(db, SAMPLE)
+    _checkpoint(db, job, help_patients="Earlier analysis.")
+    # The report passes the pre-check, so the verifier agent is skipped as well
+    assert job.start() == ("verification", "help_patients")
+    assert not job.complete
+
+
+def test_checkpointed_outputs_feed_the_later_stages_and_the_report(db, llm_calls):
+    job = _new_job(db, SAMPLE)
+    _checkpoint(db, job, help_patients="EARLIER-ANALYSIS: your AST is low.")
+    report = job.run()["final_report"]
+
+    assert llm_calls.stages() == {"nutrition_analysis", "exercise_planning"}
+    assert all("EARLIER-ANALYSIS" in prompt for _, prompt in llm_calls.prompts)
+    # Assembled from the checkpoint and this attempt's outputs
+    analysis, advice = report.split("## 2. Nutritional Recommendations", 1)
+    assert "EARLIER-ANALYSIS: your AST is low." in analysis
+    assert "finding1" in advice.split("## 4. Final Disclaimers")[0]
+
+
+def test_finished_job_is_rebuilt_from_its_checkpoints_alone(db, llm_calls):
+    job = _new_job(db, SAMPLE)
+    _checkpoint(db, job, verification="Verified.", help_patients="Analysis.", nutrition_analysis="Eat greens.",
+                exercise_planning="Walk daily.")
+    report = job.run()["final_report"]
+
+    assert llm_calls.prompts == []
+    assert "Analysis." in report and "Eat greens." in report and "Walk daily." in report
+    assert _status(db, job) == JobStatus.SUCCESS
+
+
+def test_rejected_document_is_never_retried(db):
+    job = _new_job(db, SAMPLE)
+    job.max_retries = 3
+    # Even when its message looks like a transient error
+    job.handle_error(DocumentRejected("Request timed out while reading the document; 503 Service Unavailable"))
+    assert job.retry_countdown is None
+    assert _status(db, job) == JobStatus.FAILURE
+
+
+def test_retry_reruns_only_the_failed_stage(db, llm_calls):
+    job = _new_job(db, SAMPLE)
+    job.max_retries = 1
+    llm_calls.fail.add("exercise_planning")
+    with pytest.raises(TimeoutError):
+        job.run()
+    assert job.retry_countdown is not None
+    assert _status(db, job) == JobStatus.PENDING
+
+    # The second attempt, as Celery would run it after the countdown
+    llm_calls.prompts.clear()
+    retry = AnalysisJob(job.query, job.file_path, job.result_id, retries=1, max_retries=1)
+    report = retry.run()["final_report"]
+    assert retry.skip == ("verification", "help_patients", "nutrition_analysis")
+    assert llm_calls.stages() == {"exercise_planning"}
+    assert "## 3. Exercise Recommendations" in report
+    assert _status(db, job) == JobStatus.SUCCESS
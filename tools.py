@@ -1,25 +1,81 @@
 ## Importing libraries and files
+# NOTE: this module builds the tool instances at import time, so only import it where tools are needed
+# (worker.get_crew_template). config.py already loads the .env file.
 import os
-from dotenv import load_dotenv
-load_dotenv()
+from typing import Any
 from langchain_community.document_loaders.pdf import PyPDFLoader as PDFLoader
 from crewai.tools import BaseTool
 from crewai_tools import SerperDevTool
 from crewai import LLM # ADDED: To use an LLM within our tools
 from config import shared_llm as tool_llm
-
-# --- ADD THIS FOR DEBUGGING ---
-print("--- DEBUGGING in tools.py ---")
-api_key = os.getenv("GEMINI_API_KEY")
-if api_key:
-    print("SUCCESS: GEMINI_API_KEY found.")
-else:
-    print("ERROR: GEMINI_API_KEY not found in environment!")
-print("--------------------------")
-# --- END DEBUGGING SECTION ---
+from config import REPORT_CACHE_DIR, REPORT_CACHE_MEMORY_ENTRIES, REPORT_CACHE_ENABLED
+from config import SEARCH_CACHE_ENABLED, SEARCH_CACHE_PATH, SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL_SECONDS
+from config import PDF_STREAMING_MIN_PAGES, PDF_MAX_CHARS, PDF_KEEP_FIRST_PAGES, PDF_WORKERS
+from report_cache import ReportTextCache, normalize_pages
+from pdf_ingest import page_count, stream_report_text, ingest_signature
+from biomarkers import extract_biomarkers
+from rate_limiter import get_limiter
+from search_cache import SearchCache
+
+# --- DEBUGGING: called once per worker process when the crew is first built ---
+def check_api_keys():
+    print("--- DEBUGGING in tools.py ---")
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key:
+        print("SUCCESS: GEMINI_API_KEY found.")
+    else:
+        print("ERROR: GEMINI_API_KEY not found in environment!")
+    print("--------------------------")
 
 ## Creating search tool
-search_tool = SerperDevTool()
+# MODIFIED: Searches draw from the fleet-wide Serper quota and back off together on 429s
+class RateLimitedSerperDevTool(SerperDevTool):
+    def _run(self, **kwargs):
+        return get_limiter("search").call(super()._run, **kwargs)
+
+# ADDED: Near-identical queries from any agent or worker are answered from the shared search cache
+class CachedSerperDevTool(RateLimitedSerperDevTool):
+    search_cache: Any = None
+
+    def cache_params(self, **kwargs) -> dict:
+        """Tool settings that change the results, so they are part of the cache key."""
+        return {
+            "type": kwargs.get("search_type", self.search_type),
+            "n_results": self.n_results,
+            "country": self.country,
+            "location": self.location,
+            "locale": self.locale,
+        }
+
+    def _run(self, **kwargs):
+        if self.search_cache is None:
+            return super()._run(**kwargs)
+        query = kwargs.get("search_query") or kwargs.get("query") or ""
+        search = super()._run
+        return self.search_cache.fetch(query, lambda: search(**kwargs), **self.cache_params(**kwargs))
+
+search_tool = CachedSerperDevTool(
+    search_cache=SearchCache(
+        SEARCH_CACHE_PATH,
+        max_entries=SEARCH_CACHE_MAX_ENTRIES,
+        ttl_seconds=SEARCH_CACHE_TTL_SECONDS,
+    ) if SEARCH_CACHE_ENABLED else None,
+)
+
+## Cache of cleaned report text, keyed on the PDF's content hash
+report_cache = ReportTextCache(
+    directory=REPORT_CACHE_DIR,
+    max_entries=REPORT_CACHE_MEMORY_ENTRIES,
+    enabled=REPORT_CACHE_ENABLED,
+    variant=ingest_signature(PDF_STREAMING_MIN_PAGES, PDF_MAX_CHARS, PDF_KEEP_FIRST_PAGES),
+)
+
+def extract_report_text(file_path: str) -> str:
+    """Parses the PDF and returns its cleaned text (no caching). Large PDFs are streamed page by page."""
+    if PDF_STREAMING_MIN_PAGES == 0 or page_count(file_path) >= PDF_STREAMING_MIN_PAGES:
+        return stream_report_text(file_path, PDF_MAX_CHARS, workers=PDF_WORKERS, keep_first_pages=PDF_KEEP_FIRST_PAGES)
+    docs = PDFLoader(file_path=file_path).load()
+    return normalize_pages(data.page_content for data in docs)
 
 ## Creating custom pdf reader tool
 class BloodTestReportTool(BaseTool):
@@ -29,19 +85,35 @@ class BloodTestReportTool(BaseTool):
     def _run(self, file_path: str):
         """Synchronous method to read PDF data."""
         try:
-            docs = PDFLoader(file_path=file_path).load()
-            full_report = ""
-            for data in docs:
-                content = data.page_content
-                while "\n\n" in content:
-                    content = content.replace("\n\n", "\n")
-                full_report += content + "\n"
-            return full_report
+            # The PDF is parsed once per distinct file content, later calls hit the cache
+            return report_cache.get_or_extract(file_path, extract_report_text)
         except Exception as e:
             return f"Error reading PDF file: {e}. Please ensure the file path is correct and the file is a valid PDF."
 
 blood_test_tool = BloodTestReportTool()
 
+## Creating biomarker extraction tool
+# ADDED: Gives the doctor agent a compact biomarker table instead of the full report text
+class BiomarkerExtractionTool(BaseTool):
+    name: str = "Blood Test Biomarker Extractor"
+    description: str = (
+        "Extracts every biomarker from a blood test report PDF as a compact table with its value, unit, "
+        "reference range and a HIGH/LOW flag for out-of-range values."
+    )
+
+    def _run(self, file_path: str) -> str:
+        """Parses the report's lab tables and returns them as a pipe-separated table."""
+        report_text = blood_test_tool._run(file_path)
+        if report_text.startswith("Error reading PDF file"):
+            return report_text
+        table = extract_biomarkers(report_text)
+        if not len(table):
+            # Unknown layout, let the agent work from the text itself
+            return report_text
+        return table.to_prompt()
+
+biomarker_tool = BiomarkerExtractionTool()
+
 ## Creating Nutrition Analysis Tool
 # MODIFIED: Implemented the tool's logic using an LLM
 class NutritionAnalysisTool(BaseTool):
@@ -1,55 +1,340 @@
 import os
-from crewai import Crew, Process
-
-# Import all agents and tasks
-from agents import doctor, verifier, nutritionist, exercise_specialist, report_compiler
-from task import verification, help_patients, nutrition_analysis, exercise_planning, compile_report_task
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
 
 # Import Celery app and DB components
+# NOTE: agents, tasks, tools and crewai are imported lazily (see get_crew_template) so that importing
+# this module, e.g. from client.py to enqueue a job, stays cheap.
 from celery_app import celery_app
-from database import SessionLocal, AnalysisResult, JobStatus
+from database import SessionLocal, AnalysisResult, JobStatus, set_final_report
+from config import CREW_PROCESS_MODE, REPORT_MODE, WORKER_MODE, get_shared_llm
+from config import VERIFIER_FAST_PATH, VERIFIER_ACCEPT_SCORE, VERIFIER_REJECT_SCORE, VERIFIER_MIN_TEXT_CHARS
+from config import RESUME_FROM_CHECKPOINTS, JOB_MAX_RETRIES, JOB_RETRY_BACKOFF_SECONDS, JOB_RETRY_BACKOFF_MAX_SECONDS
+from celery.utils.time import get_exponential_backoff_interval
+from progress import ProgressReporter
+from metrics import JobMetrics, JOB_SCOPE
+from rate_limiter import is_transient_error
+from report_assembler import ASSEMBLED, POLISHED, assemble_report, task_outputs
+from document_check import ACCEPT, REJECT, score_document, verification_summary
+from scheduler import dispatch
+
+ASYNC = "async"
+
+_idle_crews = {} # skip tuple -> crews built for it that no job is using right now
+_crew_pool_lock = threading.Lock()
+
+
+class DocumentRejected(Exception):
+    """Raised when the pre-check is confident the uploaded file is not a medical report."""
+
+
+def _crew_members():
+    """Imports (and so constructs) all agents and tasks. Cached by Python's module system after the first call."""
+    from agents import doctor, verifier, nutritionist, exercise_specialist, report_compiler
+    from task import verification, help_patients, nutrition_analysis, exercise_planning, compile_report_task
+
+    agents = [verifier, doctor, nutritionist, exercise_specialist]
+    tasks = [verification, help_patients, nutrition_analysis, exercise_planning]
+    if REPORT_MODE == POLISHED:
+        # IMPORTANT: In polished mode the final task must be the compile_report_task
+        agents.append(report_compiler)
+        tasks.append(compile_report_task)
+    elif REPORT_MODE != ASSEMBLED:
+        raise ValueError(f"Unknown report mode: {REPORT_MODE}")
+    return agents, tasks
+
+
+def _agent_copies():
+    """
+    Fresh copies of the agents for one crew. The originals in agents.py never run, so copying
+    them is always safe (copying an agent while its crew runs can fail with "Circular reference
+    detected"), and no two crews ever share an agent's executor.
+    """
+    agents, _ = _crew_members()
+    return [agent.copy() for agent in agents]
+
+
+def _build_medical_crew(agents, skip=()):
+    from crew_builder import build_crew
+
+    _, tasks = _crew_members()
+    # In parallel mode tasks that only share upstream context (nutrition & exercise) run concurrently.
+    return build_crew(
+        agents=agents,
+        tasks=tasks,
+        process_mode=CREW_PROCESS_MODE,
+        skip=skip,
+        # No crewai tool cache on the reused crew either (see agents.py)
+        cache=False,
+        verbose=True # Use verbose=2 for detailed logs in the worker
+    )
+
+
+@lru_cache(maxsize=None)
+def get_crew_template(skip=()):
+    """
+    Builds the medical crew (without the tasks named in `skip`) once per worker process and returns
+    the same instance afterwards. Crew inputs are interpolated from the original task/agent
+    templates on every kickoff, so one instance can serve any number of jobs run one after another.
+    """
+    from tools import check_api_keys
+
+    check_api_keys()
+    return _build_medical_crew(_agent_copies(), skip)
+
+
+def _crew_pool(skip):
+    """The idle crews for `skip`; the per-process crew template is the first of them. Call with _crew_pool_lock held."""
+    return _idle_crews.setdefault(skip, [get_crew_template(skip)])
+
+
+def prebuild_crews(count: int, skip=()):
+    """
+    Fills the pool up to `count` crews, one per concurrency slot, so that concurrent jobs
+    (async mode, threaded pools) find a crew ready instead of building one while they run.
+    """
+    get_crew_template(skip)
+    with _crew_pool_lock:
+        missing = count - len(_crew_pool(skip))
+    crews = [_build_medical_crew(_agent_copies(), skip) for _ in range(missing)]
+    with _crew_pool_lock:
+        _crew_pool(skip).extend(crews)
+
+
+@contextmanager
+def checkout_crew(skip=()):
+    """
+    Yields an idle crew from this process's pool and returns it there afterwards, so at most one
+    job uses a crew at a time. Only when every crew is busy is another one built; the pool then
+    keeps it, so it never grows past the number of jobs that ran at once.
+    """
+    get_crew_template(skip) # built outside the pool lock the first time
+    with _crew_pool_lock:
+        idle = _crew_pool(skip)
+        crew = idle.pop() if idle else None
+    if crew is None:
+        crew = _build_medical_crew(_agent_copies(), skip)
+    try:
+        yield crew
+    finally:
+        with _crew_pool_lock:
+            idle.append(crew)
+
+
+def precheck_document(file_path: str):
+    """
+    Scores the report text (parsed once, then served from the report cache to the agents' tools).
+    Returns (decision, score), or (None, None) when the pre-check is disabled.
+    """
+    if not VERIFIER_FAST_PATH:
+        return None, None
+    from tools import report_cache, extract_report_text
+
+    score = score_document(report_cache.get_or_extract(file_path, extract_report_text))
+    return score.decision(VERIFIER_ACCEPT_SCORE, VERIFIER_REJECT_SCORE, VERIFIER_MIN_TEXT_CHARS), score
+
+class AnalysisJob:
+    """
+    One analysis run for a result row, split into phases so the Celery task below and the async
+    runner (async_worker.py) go through exactly the same steps. Every phase opens its own DB
+    session, so phases may run on different threads.
+    `retries` is how many attempts came before this one; `max_retries` how many are allowed.
+    """
+
+    def __init__(self, query: str, file_path: str, result_id: int, retries: int = 0, max_retries: int = 0):
+        self.query = query
+        self.file_path = file_path
+        self.result_id = result_id
+        self.retries = retries
+        self.max_retries = max_retries
+        self.inputs = {'query': query, 'file_path': file_path}
+        self.progress = ProgressReporter(result_id)
+        self.metrics = JobMetrics(result_id)
+        self.score = None
+        self.task_names = []
+        self.checkpoints = {}
+        self.skip = ()
+        self.retry_countdown = None # set when a failed attempt should be retried
+
+    @property
+    def complete(self) -> bool:
+        """True when every task was already finished by earlier attempts."""
+        return len(self.skip) == len(self.task_names)
+
+    def start(self):
+        """
+        Marks the job RUNNING, loads the checkpoints of earlier attempts and pre-checks the document.
+        Returns the names of the tasks to skip.
+        """
+        db = SessionLocal()
+        try:
+            # Update status to RUNNING in the database
+            db.query(AnalysisResult).filter(AnalysisResult.id == self.result_id).update({"status": JobStatus.RUNNING})
+            db.commit()
+        finally:
+            db.close()
+        self.progress.status_changed(JobStatus.RUNNING)
+
+        # Every finished task's output is already in analysis_steps: a retried job continues from
+        # the first unfinished stage instead of paying for the earlier LLM work again
+        _, tasks = _crew_members()
+        self.task_names = [task.name for task in tasks]
+        if RESUME_FROM_CHECKPOINTS:
+            checkpoints = self.progress.checkpoints()
+            self.checkpoints = {name: checkpoints[name] for name in self.task_names if name in checkpoints}
+        if self.checkpoints:
+            print(f"Resuming result {self.result_id}, already finished: {', '.join(self.checkpoints)}")
+
+        # Clear non-reports fail here, before any LLM call; clear reports skip the verifier agent
+        decision = None
+        if "verification" not in self.checkpoints:
+            decision, self.score = precheck_document(self.file_path)
+            if decision == REJECT:
+                raise DocumentRejected(f"The document at {self.file_path} does not appear to be a medical report ({self.score.describe()}).")
+            print(f"Document pre-check for result {self.result_id}: {decision or 'disabled'}" + (f" ({self.score.describe()})" if self.score else ""))
+        skipped = set(self.checkpoints) | ({"verification"} if decision == ACCEPT else set())
+        self.skip = tuple(name for name in self.task_names if name in skipped)
+        return self.skip
+
+    def attach(self, medical_crew):
+        """
+        Routes the crew's progress and metrics to this job: each task's output is recorded and published
+        as soon as that task finishes; wall time, LLM calls, tokens and retries are recorded per task, agent and tool.
+        """
+        if self.skip:
+            from crew_builder import prefill_outputs
+
+            new = {}
+            if "verification" in self.skip and "verification" not in self.checkpoints:
+                new["verification"] = verification_summary(self.file_path, self.score)
+            for task in prefill_outputs(medical_crew, {**self.checkpoints, **new}):
+                if task.name in new:
+                    self.progress.task_completed(task, task.output)
+        self.progress.attach(medical_crew.tasks)
+        self.metrics.attach(medical_crew.tasks)
+
+    def detach(self, medical_crew):
+        self.metrics.detach(medical_crew.tasks)
+
+    def run(self) -> dict:
+        """Runs the whole job on the calling thread."""
+        try:
+            skip = self.start()
+            if self.complete:
+                return self.finish(None, {})
+            # Kick off the reusable crew with the provided inputs.
+            with checkout_crew(skip) as medical_crew:
+                self.attach(medical_crew)
+                try:
+                    result = medical_crew.kickoff(self.inputs)
+                    outputs = task_outputs(medical_crew.tasks)
+                finally:
+                    self.detach(medical_crew)
+            return self.finish(result, outputs)
+        except Exception as e:
+            self.handle_error(e)
+            raise
+
+    def finish(self, result, outputs: dict) -> dict:
+        """
+        Builds the final report from the crew's result and task outputs (plus those checkpointed by
+        earlier attempts) and marks the job SUCCESS. `result` is None if no task was left to run.
+        """
+        shared_llm = get_shared_llm()
+        if shared_llm.cache is not None:
+            print(f"LLM cache stats: {shared_llm.cache.stats()}")
+
+        outputs = {**self.checkpoints, **outputs}
+        if REPORT_MODE == ASSEMBLED:
+            # Built locally from the specialists' outputs instead of a compile_report_task LLM call
+            final_report = assemble_report(outputs, self.query)
+        else:
+            final_report = str(result) if result is not None else outputs[self.task_names[-1]]
+
+        # Update the database with the final report and SUCCESS status
+        # (long reports are stored compressed in the analysis_reports side table)
+        db = SessionLocal()
+        try:
+            set_final_report(db, self.result_id, final_report)
+            db.query(AnalysisResult).filter(AnalysisResult.id == self.result_id).update({"status": JobStatus.SUCCESS})
+            db.commit()
+        finally:
+            db.close()
+        self.metrics.save()
+        self.progress.status_changed(JobStatus.SUCCESS)
+        self.release_slot()
+        return {"status": "Complete", "result_id": self.result_id, "final_report": final_report}
+
+    def handle_error(self, error: Exception):
+        """Schedules a retry for a transient error while retries are left, otherwise marks the job FAILURE."""
+        # A rejected document fails fast, whatever its path or the error message contain
+        if self.retries < self.max_retries and not isinstance(error, DocumentRejected) and is_transient_error(error):
+            self.retry_countdown = get_exponential_backoff_interval(
+                JOB_RETRY_BACKOFF_SECONDS, self.retries, JOB_RETRY_BACKOFF_MAX_SECONDS, full_jitter=True
+            )
+            self.retrying(error)
+        else:
+            # If an error occurs, update the status to FAILURE and store the error message
+            self.fail(error)
+
+    def retrying(self, error: Exception):
+        """Puts the job back to PENDING (keeping its dedupe key and batch slot) until the retry starts."""
+        message = (
+            f"Transient error, retrying in {self.retry_countdown}s "
+            f"(attempt {self.retries + 2} of {self.max_retries + 1}): {error}"
+        )
+        print(f"Result {self.result_id}: {message}")
+        db = SessionLocal()
+        try:
+            db.query(AnalysisResult).filter(AnalysisResult.id == self.result_id).update({"status": JobStatus.PENDING})
+            db.commit()
+        finally:
+            db.close()
+        self.metrics.add(*JOB_SCOPE, retries=1)
+        self.metrics.save(failed=True)
+        self.progress.status_changed(JobStatus.PENDING, message)
+
+    def fail(self, error: Exception):
+        """Stores the error message as the report and marks the job FAILURE."""
+        error_message = f"An error occurred: {str(error)}"
+        db = SessionLocal()
+        try:
+            set_final_report(db, self.result_id, error_message)
+            # Clearing the dedupe key lets an identical resubmission start a fresh run
+            db.query(AnalysisResult).filter(AnalysisResult.id == self.result_id).update({"status": JobStatus.FAILURE, "dedupe_key": None})
+            db.commit()
+        finally:
+            db.close()
+        self.metrics.save(failed=True)
+        self.progress.status_changed(JobStatus.FAILURE, error_message)
+        self.release_slot()
+
+    def release_slot(self):
+        """Lets the scheduler hand waiting batch jobs to Celery now that this job is done."""
+        try:
+            dispatch()
+        except Exception as e:
+            # Scheduling must never fail the analysis itself; `python scheduler.py dispatch` catches up
+            print(f"Warning: could not dispatch waiting batch jobs: {e}")
+
 
 @celery_app.task(bind=True)
 def run_crew_analysis(self, query: str, file_path: str, result_id: int):
     """
     Celery task to run the full medical analysis crew and save the result to the database.
+    With WORKER_MODE=async the job is handed to this process's event loop instead (async_worker.py).
+    Transient errors are retried with exponential backoff; a retry resumes after the finished stages.
     """
-    db = SessionLocal()
+    job = AnalysisJob(query, file_path, result_id, retries=self.request.retries, max_retries=JOB_MAX_RETRIES)
     try:
-        # Update status to RUNNING in the database
-        db.query(AnalysisResult).filter(AnalysisResult.id == result_id).update({"status": JobStatus.RUNNING})
-        db.commit()
-
-        # Assemble the full crew with all agents and tasks
-        medical_crew = Crew(
-            agents=[verifier, doctor, nutritionist, exercise_specialist, report_compiler],
-            # IMPORTANT: The final task must be the compile_report_task
-            tasks=[verification, help_patients, nutrition_analysis, exercise_planning, compile_report_task],
-            process=Process.sequential,
-            verbose=True # Use verbose=2 for detailed logs in the worker
-        )
-
-        # Kick off the crew with the provided inputs
-        result = medical_crew.kickoff({'query': query, 'file_path': file_path})
-        
-        # Update the database with the final report and SUCCESS status
-        db.query(AnalysisResult).filter(AnalysisResult.id == result_id).update({
-            "final_report": str(result),
-            "status": JobStatus.SUCCESS
-        })
-        db.commit()
-        
-        return {"status": "Complete", "result_id": result_id, "final_report": str(result)}
+        if WORKER_MODE == ASYNC:
+            from async_worker import get_runner
 
+            return get_runner().run_blocking(job)
+        return job.run()
     except Exception as e:
-        # If an error occurs, update the status to FAILURE and store the error message
-        error_message = f"An error occurred: {str(e)}"
-        db.query(AnalysisResult).filter(AnalysisResult.id == result_id).update({
-            "final_report": error_message,
-            "status": JobStatus.FAILURE
-        })
-        db.commit()
+        if job.retry_countdown is not None:
+            raise self.retry(exc=e, countdown=job.retry_countdown, max_retries=JOB_MAX_RETRIES)
         # You might want to re-raise the exception for Celery to mark it as a failure
         raise e
-    finally:
-        db.close()
\ No newline at end of file